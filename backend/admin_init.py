@@ -1,26 +1,34 @@
 import os
-import sys
 from loguru import logger
+from sqlalchemy import exists
 from sqlalchemy.orm import Session
 
-# Add shared directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-
 from backend.auth_service import auth_service
 from backend.database import get_database_manager
 from shared.auth_models import UserRole
 
+def warm_auth_backends():
+    """Load the password hashing and JWT backends now so the first login doesn't pay for it"""
+    try:
+        warm_hash = auth_service.get_password_hash("warmup")
+        auth_service.verify_password("warmup", warm_hash)
+        auth_service.verify_token(auth_service.create_access_token({"sub": "warmup", "user_id": 0}))
+        logger.debug("Password hashing and JWT backends warmed up")
+    except Exception as e:
+        logger.warning(f"Auth backend warm-up failed: {e}")
+
 def initialize_admin_user():
     """Initialize default admin user if none exists"""
     try:
         db_manager = get_database_manager()
+        warm_auth_backends()
         
         with db_manager.get_session_context() as db:
             # Check if any admin users exist
             from shared.auth_models import UserTable
-            admin_user = db.query(UserTable).filter_by(role=UserRole.ADMIN.value).first()
+            has_admin = db.query(exists().where(UserTable.role == UserRole.ADMIN.value)).scalar()
             
-            if admin_user is None:
+            if not has_admin:
                 logger.info("No admin users found. Creating default admin user...")
                 
                 # Get admin credentials from environment or use defaults
@@ -1,26 +1,61 @@
-import httpx
+import aiohttp
 import asyncio
-import json
-from typing import List, Optional, Dict, Any
+import functools
+import hashlib
+import orjson
+import re
+from dataclasses import fields, replace
+from itertools import islice
+from typing import List, Optional, Dict, Any, Tuple, Sequence, AsyncIterator
 from datetime import datetime
 from loguru import logger
-import sys
-import os
-
-# Add shared directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from shared.models import ChatMessage, AIConfig, MessageType
-from shared.config import Config
+from shared.config import Config, RedisKeys
+
+# Placeholder for the current time in cached system prompt templates
+_TIMESTAMP_SLOT = "{ts}"
+
+# Settable AIConfig fields and config keys whose values must be masked in logs
+_AICONFIG_FIELDS = frozenset(field.name for field in fields(AIConfig))
+_SENSITIVE_RE = re.compile(r"key|token|secret", re.I)
+
+# Response caching: only near-deterministic sampling is cached, to keep replies varied
+_CACHE_MAX_TEMPERATURE = 0.3
+_RESPONSE_CACHE_TTL = 300  # seconds
+_MODEL_INFO_CACHE_TTL = 60  # seconds
+
+
+def _mask(value: Any) -> str:
+    """Mask all but the last four characters of a sensitive value"""
+    value = str(value)
+    return f"{'*' * (len(value) - 4)}{value[-4:]}" if len(value) > 4 else "****"
 
 
 class AIService:
-    def __init__(self):
+    def __init__(self, redis_client=None):
         self.config = AIConfig(
             model_url=Config.AI_MODEL_URL,
             api_key=Config.AI_API_KEY
         )
-        self.client = httpx.AsyncClient(timeout=Config.AI_RESPONSE_TIMEOUT)
+        # Shared keep-alive connection pool for concurrent AI requests
+        self._connector = aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=Config.AI_MAX_CONCURRENCY,
+            keepalive_timeout=30
+        )
+        self.client = aiohttp.ClientSession(
+            connector=self._connector,
+            timeout=aiohttp.ClientTimeout(total=Config.AI_RESPONSE_TIMEOUT),
+            headers={"Content-Type": "application/json"}
+        )
+        # Cap in-flight completions so bursts queue here instead of swamping the model
+        self._inflight = asyncio.Semaphore(Config.AI_MAX_CONCURRENCY)
+        self._default_template = self._room_template(None)
+        # Optional Redis client for caching completions and model info
+        self.redis = redis_client
+        self._auth_headers = self._build_auth_headers()
+        self._build_urls()
         logger.info(f"AI Service initialized with model URL: {self.config.model_url}")
     
     async def generate_response(
@@ -32,51 +67,65 @@ class AIService:
         model_name: Optional[str] = None
     ) -> Optional[str]:
         """Generate AI response to user message with chat context"""
+        # Snapshot config values used more than once on this path
+        cfg = self.config
+        temperature = cfg.temperature
+        max_tokens = cfg.max_tokens
+        
         try:
             # Build conversation context
             messages = await self._build_conversation_context(user_message, username, chat_history, room_prompt)
             
             # Use room-specific model if provided, otherwise fall back to default
-            selected_model = model_name or self.config.model_name
+            selected_model = model_name or cfg.model_name
             
-            # Log which model is being used
+            # Log which model is being used (args are only formatted if INFO is enabled)
             if model_name:
-                logger.info(f"Using room-specific model: {selected_model}")
+                logger.info("Using room-specific model: {}", selected_model)
             else:
-                logger.info(f"Using default model: {selected_model}")
+                logger.info("Using default model: {}", selected_model)
             
             # Prepare request payload
             payload = {
                 "model": selected_model,
                 "messages": messages,
-                "temperature": self.config.temperature,
-                "max_tokens": self.config.max_tokens,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
                 "stream": False
             }
             
-            # Add API key if provided
-            headers = {"Content-Type": "application/json"}
-            if self.config.api_key:
-                headers["Authorization"] = f"Bearer {self.config.api_key}"
+            # Serve repeated prompts from cache when sampling is near-deterministic
+            cache_key = None
+            if self.redis is not None and temperature <= _CACHE_MAX_TEMPERATURE:
+                cache_key = self._response_cache_key(selected_model, temperature, max_tokens, room_prompt, messages)
+                cached = await self._cache_get(cache_key)
+                if cached is not None:
+                    logger.debug("Serving cached AI response for user {}", username)
+                    return cached.decode()
             
             # Make request to AI model
-            response = await self.client.post(
-                f"{self.config.model_url}/v1/chat/completions",
-                json=payload,
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                ai_response = result["choices"][0]["message"]["content"].strip()
-                
-                logger.info(f"Generated AI response for user {username}: {ai_response[:100]}...")
-                return ai_response
-            else:
-                logger.error(f"AI API error: {response.status_code} - {response.text}")
-                return "Sorry, I'm having trouble processing your request right now."
-                
-        except httpx.TimeoutException:
+            if self._inflight.locked():
+                logger.warning(f"AI concurrency limit ({Config.AI_MAX_CONCURRENCY}) reached, queueing request for {username}")
+            
+            async with self._inflight:
+                async with self.client.post(
+                    self._chat_url,
+                    data=orjson.dumps(payload),
+                    headers=self._auth_headers
+                ) as response:
+                    if response.status == 200:
+                        result = await response.json(loads=orjson.loads)
+                        ai_response = result["choices"][0]["message"]["content"].strip()
+                        
+                        logger.info("Generated AI response for user {}: {}...", username, ai_response[:100])
+                        if cache_key:
+                            await self._cache_set(cache_key, ai_response, _RESPONSE_CACHE_TTL)
+                        return ai_response
+                    else:
+                        logger.error(f"AI API error: {response.status} - {await response.text()}")
+                        return "Sorry, I'm having trouble processing your request right now."
+                    
+        except asyncio.TimeoutError:
             logger.error("AI request timeout")
             return "Sorry, I'm taking too long to respond. Please try again."
         except Exception as e:
@@ -87,46 +136,93 @@ class AIService:
         self, 
         current_message: str, 
         username: str, 
-        chat_history: List[ChatMessage] = None,
+        chat_history: Sequence[ChatMessage] = None,
         room_prompt: Optional[str] = None
     ) -> List[Dict[str, str]]:
         """Build conversation context for AI model"""
-        messages = []
+        chat_history = chat_history or ()
+        history_len = len(chat_history)
+        start = max(0, history_len - 8)  # Last 8 messages for context
+        
+        # Preallocate for system prompt + history + current message
+        messages = [None] * (history_len - start + 2)
         
         # Add system prompt
-        messages.append({
+        messages[0] = {
             "role": "system",
             "content": self._get_system_prompt(room_prompt)
-        })
+        }
+        index = 1
         
         # Add recent chat history for context
-        if chat_history:
-            for msg in chat_history[-8:]:  # Last 8 messages for context
-                if msg.message_type == MessageType.USER:
-                    messages.append({
-                        "role": "user",
-                        "content": f"{msg.sender_name}: {msg.content}"
-                    })
-                elif msg.message_type == MessageType.AI:
-                    messages.append({
-                        "role": "assistant",
-                        "content": msg.content
-                    })
+        for msg in islice(chat_history, start, None):
+            if msg.message_type == MessageType.USER:
+                messages[index] = {
+                    "role": "user",
+                    "content": f"{msg.sender_name}: {msg.content}"
+                }
+                index += 1
+            elif msg.message_type == MessageType.AI:
+                messages[index] = {
+                    "role": "assistant",
+                    "content": msg.content
+                }
+                index += 1
         
         # Add current user message
-        messages.append({
+        messages[index] = {
             "role": "user",
             "content": f"{username}: {current_message}"
-        })
+        }
         
+        # Drop unused slots left by skipped (e.g. system) history messages
+        del messages[index + 1:]
         return messages
     
+    @staticmethod
+    def _response_cache_key(
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        room_prompt: Optional[str],
+        messages: List[Dict[str, str]]
+    ) -> str:
+        """Hash everything that determines a completion into a cache key"""
+        # The system message embeds the current time, so key on the room prompt instead
+        digest = hashlib.blake2b(
+            orjson.dumps((model, temperature, max_tokens, room_prompt, messages[1:])),
+            digest_size=16
+        ).hexdigest()
+        return RedisKeys.AI_RESPONSE_CACHE.format(digest=digest)
+    
+    async def _cache_get(self, key: str) -> Optional[bytes]:
+        """Read a cached value, treating Redis errors as a miss"""
+        try:
+            return await self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"AI cache read failed: {e}")
+            return None
+    
+    async def _cache_set(self, key: str, value: Any, ttl: int):
+        """Store a value in the cache, ignoring Redis errors"""
+        try:
+            await self.redis.set(key, value, ex=ttl)
+        except Exception as e:
+            logger.warning(f"AI cache write failed: {e}")
+    
     def _get_system_prompt(self, room_prompt: Optional[str] = None) -> str:
         """Get system prompt for AI model, using room-specific prompt if available"""
+        head, tail = self._room_template(room_prompt) if room_prompt else self._default_template
+        return f"{head}{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{tail}"
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _room_template(room_prompt: Optional[str] = None) -> Tuple[str, str]:
+        """Build the system prompt template, split around the current-time slot"""
         
         if room_prompt:
             # Use custom room prompt but ensure Styx identity and basic guidelines
-            return f"""You are Styx, an AI assistant participating in this chat room.
+            template = f"""You are Styx, an AI assistant participating in this chat room.
 
 Room-specific instructions:
 {room_prompt}
@@ -136,12 +232,12 @@ Basic guidelines:
 - Keep responses concise but informative unless the room prompt specifies otherwise
 - You can see the chat history and respond to the current conversation context
 - Address users by name when appropriate
-- Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+- Current time: {_TIMESTAMP_SLOT}
 
 Follow the room-specific instructions above while maintaining natural conversation."""
         else:
             # Default system prompt
-            return f"""You are Styx, a helpful AI assistant participating in a group chat. 
+            template = f"""You are Styx, a helpful AI assistant participating in a group chat. 
 
 Guidelines:
 - Be friendly, engaging, and conversational
@@ -154,9 +250,13 @@ Guidelines:
 - You can engage in casual conversation as well as answer questions
 - If someone asks about technical topics, provide accurate and helpful information
 
-Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+Current time: {_TIMESTAMP_SLOT}
 
 Respond naturally as if you're another participant in the chat."""
+        
+        # Split on the last slot so a "{ts}" inside a room prompt is left untouched
+        head, _, tail = template.rpartition(_TIMESTAMP_SLOT)
+        return head, tail
     
     async def generate_system_message(self, message_type: str, context: Dict[str, Any]) -> Optional[str]:
         """Generate system messages for events like user joining/leaving"""
@@ -182,17 +282,12 @@ Respond naturally as if you're another participant in the chat."""
     async def check_health(self) -> bool:
         """Check if AI service is healthy"""
         try:
-            headers = {"Content-Type": "application/json"}
-            if self.config.api_key:
-                headers["Authorization"] = f"Bearer {self.config.api_key}"
-            
-            response = await self.client.get(
-                f"{self.config.model_url}/v1/models",
-                headers=headers,
-                timeout=5.0
-            )
-            
-            return response.status_code == 200
+            async with self.client.get(
+                self._models_url,
+                headers=self._auth_headers,
+                timeout=aiohttp.ClientTimeout(total=5.0)
+            ) as response:
+                return response.status == 200
             
         except Exception as e:
             logger.warning(f"AI health check failed: {e}")
@@ -201,17 +296,20 @@ Respond naturally as if you're another participant in the chat."""
     async def get_model_info(self) -> Optional[Dict[str, Any]]:
         """Get information about the AI model"""
         try:
-            headers = {"Content-Type": "application/json"}
-            if self.config.api_key:
-                headers["Authorization"] = f"Bearer {self.config.api_key}"
-            
-            response = await self.client.get(
-                f"{self.config.model_url}/v1/models",
-                headers=headers
-            )
+            if self.redis is not None:
+                cached = await self._cache_get(RedisKeys.AI_MODEL_INFO)
+                if cached is not None:
+                    return orjson.loads(cached)
             
-            if response.status_code == 200:
-                return response.json()
+            async with self.client.get(
+                self._models_url,
+                headers=self._auth_headers
+            ) as response:
+                if response.status == 200:
+                    body = await response.read()
+                    if self.redis is not None:
+                        await self._cache_set(RedisKeys.AI_MODEL_INFO, body, _MODEL_INFO_CACHE_TTL)
+                    return orjson.loads(body)
             
             return None
             
@@ -221,27 +319,115 @@ Respond naturally as if you're another participant in the chat."""
     
     async def close(self):
         """Close the HTTP client"""
-        await self.client.aclose()
+        await self.client.close()
+    
+    def _build_auth_headers(self) -> Dict[str, str]:
+        """Build per-request headers (Content-Type is a client default)"""
+        if self.config.api_key:
+            return {"Authorization": f"Bearer {self.config.api_key}"}
+        return {}
+    
+    def _build_urls(self):
+        """Resolve the model endpoint URLs from the configured base URL"""
+        self._chat_url = f"{self.config.model_url}/v1/chat/completions"
+        self._models_url = f"{self.config.model_url}/v1/models"
     
     def update_config(self, **kwargs):
         """Update AI configuration"""
         for key, value in kwargs.items():
-            if hasattr(self.config, key):
-                setattr(self.config, key, value)
+            if key in _AICONFIG_FIELDS:
+                self.config = replace(self.config, **{key: value})
                 # SECURITY FIX: Mask sensitive values in logs
-                if 'key' in key.lower() or 'token' in key.lower() or 'secret' in key.lower():
-                    masked_value = f"{'*' * (len(str(value)) - 4)}{str(value)[-4:]}" if len(str(value)) > 4 else "****"
-                    logger.info(f"Updated AI config: {key} = {masked_value}")
+                if _SENSITIVE_RE.search(key):
+                    logger.info("Updated AI config: {} = {}", key, _mask(value))
                 else:
-                    logger.info(f"Updated AI config: {key} = {value}")
+                    logger.info("Updated AI config: {} = {}", key, value)
+                
+                if key == "api_key":
+                    self._auth_headers = self._build_auth_headers()
+                elif key == "model_url":
+                    self._build_urls()
     
     async def stream_response(
         self,
         user_message: str,
         username: str,
-        chat_history: List[ChatMessage] = None
-    ) -> Optional[str]:
-        """Generate streaming AI response (for future enhancement)"""
-        # This could be implemented for real-time streaming responses
-        # For now, just use the regular generate_response method
-        return await self.generate_response(user_message, username, chat_history) 
\ No newline at end of file
+        chat_history: List[ChatMessage] = None,
+        room_prompt: Optional[str] = None,
+        model_name: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Generate AI response as it is produced, yielding content deltas"""
+        cfg = self.config
+        yielded = False
+        
+        try:
+            messages = await self._build_conversation_context(user_message, username, chat_history, room_prompt)
+            selected_model = model_name or cfg.model_name
+            logger.info("Streaming response from model: {}", selected_model)
+            
+            payload = {
+                "model": selected_model,
+                "messages": messages,
+                "temperature": cfg.temperature,
+                "max_tokens": cfg.max_tokens,
+                "stream": True
+            }
+            
+            # Serve repeated prompts from cache, as one chunk, when sampling is near-deterministic
+            cache_key = None
+            if self.redis is not None and cfg.temperature <= _CACHE_MAX_TEMPERATURE:
+                cache_key = self._response_cache_key(selected_model, cfg.temperature, cfg.max_tokens, room_prompt, messages)
+                cached = await self._cache_get(cache_key)
+                if cached is not None:
+                    logger.debug("Serving cached AI response for user {}", username)
+                    yield cached.decode()
+                    return
+            parts = []
+            
+            if self._inflight.locked():
+                logger.warning(f"AI concurrency limit ({Config.AI_MAX_CONCURRENCY}) reached, queueing request for {username}")
+            
+            async with self._inflight:
+                async with self.client.post(
+                    self._chat_url,
+                    data=orjson.dumps(payload),
+                    headers=self._auth_headers,
+                    # Long answers may exceed the total timeout; bound the gap between chunks instead
+                    timeout=aiohttp.ClientTimeout(total=None, sock_read=Config.AI_RESPONSE_TIMEOUT)
+                ) as response:
+                    if response.status != 200:
+                        logger.error(f"AI API error: {response.status} - {await response.text()}")
+                        yield "Sorry, I'm having trouble processing your request right now."
+                        return
+                    
+                    # Server-sent events: one "data: {...}" line per chunk, ending with [DONE]
+                    async for line in response.content:
+                        if not line.startswith(b"data: "):
+                            continue
+                        data = line[6:].strip()
+                        if data == b"[DONE]":
+                            break
+                        
+                        choices = orjson.loads(data).get("choices")
+                        if not choices:
+                            continue
+                        delta = choices[0].get("delta", {}).get("content")
+                        if delta:
+                            yielded = True
+                            if cache_key is not None:
+                                parts.append(delta)
+                            yield delta
+            
+            # Only a stream that ran to completion is cached
+            if cache_key is not None and parts:
+                await self._cache_set(cache_key, "".join(parts), _RESPONSE_CACHE_TTL)
+            logger.info("Finished streaming AI response for user {}", username)
+        
+        except asyncio.TimeoutError:
+            logger.error("AI streaming request timeout")
+            if not yielded:
+                yield "Sorry, I'm taking too long to respond. Please try again."
+        except Exception as e:
+            logger.error(f"Error streaming AI response: {e}")
+            if not yielded:
+                yield "Sorry, I encountered an error while processing your message."
@@ -1,20 +1,102 @@
-import os
-import sys
+import time
+import redis.asyncio as redis
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, make_transient_to_detached
 from typing import Optional
+from loguru import logger
 
-# Add shared directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-
-from shared.auth_models import UserTable, UserRole
+from shared.auth_models import UserTable
+from shared.config import RedisKeys
 from backend.auth_service import auth_service
 from backend.database import get_db_session
 
 # Security scheme for Bearer tokens
 security = HTTPBearer(auto_error=False)
 
+# Recently verified bearer tokens -> (user column values, token expiry). Each
+# request gets its own UserTable built from the values, so a handler that
+# mutates its user never affects other requests or the cache.
+# Process-local; user changes are published on Redis so every worker evicts
+# its own entries (see invalidate_user_tokens).
+_token_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+# Set at startup; None means a single process with nothing to notify
+invalidation_redis: Optional[redis.Redis] = None
+
+def _load_user(token: str, db: Session):
+    """Verify token and load its user from the database; returns (user, token expiry)"""
+    # Raises HTTPException for invalid tokens
+    token_data = auth_service.verify_token(token)
+    user = auth_service.get_user_by_id(db, token_data.user_id)
+    
+    if user is not None and user.is_active:
+        # Detach so the snapshot stays readable after this request's session closes
+        db.expunge(user)
+    
+    return user, token_data.exp
+
+def _user_values(user: UserTable) -> dict:
+    """Column values of a user row, for caching"""
+    return {column.key: getattr(user, column.key) for column in UserTable.__table__.columns}
+
+def _user_from_values(values: dict) -> UserTable:
+    """Build a fresh detached user from cached column values"""
+    user = UserTable(**values)
+    make_transient_to_detached(user)
+    return user
+
+async def _resolve_user(token: str, db: Session) -> Optional[UserTable]:
+    """Verify token and load its user, reusing a recent verification if cached"""
+    cached = _token_cache.get(token)
+    if cached is not None:
+        values, expires_at = cached
+        if expires_at is None or expires_at > time.time():
+            return _user_from_values(values)
+        _token_cache.pop(token, None)
+    
+    # The SELECT runs in the threadpool; the cache is only touched on the event loop
+    user, expires_at = await run_in_threadpool(_load_user, token, db)
+    if user is not None and user.is_active:
+        _token_cache[token] = (_user_values(user), expires_at)
+    
+    return user
+
+async def _request_user(request: Request, token: str, db: Session) -> Optional[UserTable]:
+    """Resolve the request's user once and remember it on request.state"""
+    if getattr(request.state, "auth_token", None) == token:
+        return request.state.user
+    
+    # Raises HTTPException for invalid tokens (nothing is remembered then)
+    user = await _resolve_user(token, db)
+    request.state.auth_token = token
+    request.state.user = user
+    return user
+
+def invalidate_token(token: str):
+    """Drop a single cached token (e.g. on logout)"""
+    _token_cache.pop(token, None)
+
+def evict_user(user_id: int):
+    """Drop this worker's cached tokens and user row for a user"""
+    auth_service.invalidate_user_cache(user_id)
+    for token, (values, _) in list(_token_cache.items()):
+        if values["id"] == user_id:
+            _token_cache.pop(token, None)
+
+async def invalidate_user_tokens(user_id: int):
+    """Drop cached tokens and user rows for a user on every worker (e.g. after profile/password changes)"""
+    evict_user(user_id)
+    
+    if invalidation_redis is not None:
+        # Other workers evict theirs when the relay receives it
+        try:
+            await invalidation_redis.publish(RedisKeys.USER_INVALIDATIONS, str(user_id))
+        except Exception as e:
+            logger.error(f"Error publishing cache invalidation for user {user_id}: {e}")
+
 async def get_current_user(
     request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
@@ -28,11 +110,8 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verify token
-    token_data = auth_service.verify_token(credentials.credentials)
-    
-    # Get user from database
-    user = auth_service.get_user_by_id(db, token_data.user_id)
+    # Verify token and get user from database (or recent cache)
+    user = await _request_user(request, credentials.credentials, db)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -53,7 +132,7 @@ async def get_current_admin_user(
     current_user: UserTable = Depends(get_current_user)
 ) -> UserTable:
     """Get current authenticated admin user"""
-    if current_user.role != UserRole.ADMIN.value:
+    if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin access required"
@@ -62,6 +141,7 @@ async def get_current_admin_user(
     return current_user
 
 async def get_optional_current_user(
+    request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     db: Session = Depends(get_db_session)
 ) -> Optional[UserTable]:
@@ -70,8 +150,7 @@ async def get_optional_current_user(
         return None
     
     try:
-        token_data = auth_service.verify_token(credentials.credentials)
-        user = auth_service.get_user_by_id(db, token_data.user_id)
+        user = await _request_user(request, credentials.credentials, db)
         
         if user and user.is_active:
             return user
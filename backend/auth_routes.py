@@ -1,37 +1,54 @@
+import asyncio
 import os
-import sys
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import APIRouter, Depends, HTTPException, status, Body
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import List
 
-# Add shared directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-
 from shared.auth_models import (
-    LoginRequest, LoginResponse, UserCreate, UserResponse, UserUpdate,
+    LoginRequest, LoginResponse, UserCreate, UserResponse, UserUpdate, UserUpdateSelf,
     PasswordChangeRequest, AdminUserCreateRequest, UserRole
 )
 from backend.auth_service import auth_service
-from backend.auth_middleware import get_current_user, get_current_admin_user
+from backend.auth_middleware import (
+    get_current_user, get_current_admin_user, security,
+    invalidate_token, invalidate_user_tokens
+)
 from backend.database import get_db_session
 
 # Create router for authentication endpoints
 auth_router = APIRouter(prefix="/auth", tags=["authentication"])
 admin_router = APIRouter(prefix="/admin", tags=["admin"])
 
+# Reusable validator for serializing lists of ORM users in one pass
+_users_adapter = TypeAdapter(List[UserResponse])
+
+# Password hashing is deliberately slow; run it off the event loop, one thread per core
+# (argon2/bcrypt release the GIL, so logins hash in parallel up to the core count)
+_hash_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="password-hash")
+
+async def _run_password_work(func, *args):
+    """Run a blocking password hash/verify call in the hashing thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, func, *args)
+
 @auth_router.post("/login", response_model=LoginResponse)
 async def login(
     login_data: LoginRequest,
     db: Session = Depends(get_db_session)
 ):
     """Login user and return access token"""
-    return auth_service.login(db, login_data.username, login_data.password)
+    return await _run_password_work(auth_service.login, db, login_data.username, login_data.password)
 
 @auth_router.post("/logout")
 async def logout(
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    credentials = Depends(security)
 ):
     """Logout user (client should discard token)"""
+    invalidate_token(credentials.credentials)
     return {"message": "Successfully logged out"}
 
 @auth_router.get("/me", response_model=UserResponse)
@@ -43,19 +60,13 @@ async def get_current_user_info(
 
 @auth_router.put("/me", response_model=UserResponse)
 async def update_current_user(
-    user_update: UserUpdate,
+    user_update: UserUpdateSelf,
     current_user = Depends(get_current_user),
     db: Session = Depends(get_db_session)
 ):
-    """Update current user information"""
-    # Users can't change their own role
-    if user_update.role is not None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Cannot change your own role"
-        )
-    
-    updated_user = auth_service.update_user(db, current_user.id, user_update)
+    """Update current user information (role and account flags are rejected by UserUpdateSelf)"""
+    updated_user = await run_in_threadpool(auth_service.update_user, db, current_user.id, user_update)
+    await invalidate_user_tokens(current_user.id)
     return UserResponse.from_orm(updated_user)
 
 @auth_router.post("/change-password")
@@ -65,12 +76,14 @@ async def change_password(
     db: Session = Depends(get_db_session)
 ):
     """Change user password"""
-    auth_service.change_password(
+    await _run_password_work(
+        auth_service.change_password,
         db, 
         current_user.id, 
         password_data.current_password, 
         password_data.new_password
     )
+    await invalidate_user_tokens(current_user.id)
     return {"message": "Password changed successfully"}
 
 # Admin routes
@@ -82,8 +95,8 @@ async def get_all_users(
     db: Session = Depends(get_db_session)
 ):
     """Get all users (admin only)"""
-    users = auth_service.get_all_users(db, skip=skip, limit=limit)
-    return [UserResponse.from_orm(user) for user in users]
+    users = await run_in_threadpool(auth_service.get_all_users, db, skip=skip, limit=limit)
+    return _users_adapter.validate_python(users, from_attributes=True)
 
 @admin_router.post("/users", response_model=UserResponse)
 async def create_user(
@@ -101,7 +114,7 @@ async def create_user(
         is_kid_account=user_data.is_kid_account
     )
     
-    created_user = auth_service.create_user(db, new_user)
+    created_user = await _run_password_work(auth_service.create_user, db, new_user)
     return UserResponse.from_orm(created_user)
 
 @admin_router.put("/users/{user_id}", response_model=UserResponse)
@@ -112,7 +125,8 @@ async def update_user(
     db: Session = Depends(get_db_session)
 ):
     """Update user (admin only)"""
-    updated_user = auth_service.update_user(db, user_id, user_update)
+    updated_user = await run_in_threadpool(auth_service.update_user, db, user_id, user_update)
+    await invalidate_user_tokens(user_id)
     return UserResponse.from_orm(updated_user)
 
 @admin_router.delete("/users/{user_id}")
@@ -129,7 +143,8 @@ async def delete_user(
             detail="Cannot delete your own account"
         )
     
-    auth_service.delete_user(db, user_id)
+    await run_in_threadpool(auth_service.delete_user, db, user_id)
+    await invalidate_user_tokens(user_id)
     return {"message": "User deleted successfully"}
 
 @admin_router.post("/users/{user_id}/reset-password")
@@ -140,7 +155,7 @@ async def reset_user_password(
     db: Session = Depends(get_db_session)
 ):
     """Reset user password (admin only)"""
-    user = auth_service.get_user_by_id(db, user_id)
+    user = await run_in_threadpool(auth_service.get_user_by_id, db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -148,8 +163,9 @@ async def reset_user_password(
         )
     
     # Update password directly (bypass current password check)
-    user.hashed_password = auth_service.get_password_hash(new_password)
-    db.commit()
+    user.hashed_password = await _run_password_work(auth_service.get_password_hash, new_password)
+    await run_in_threadpool(db.commit)
+    await invalidate_user_tokens(user_id)
     
     return {"message": "Password reset successfully"}
 
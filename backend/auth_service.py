@@ -1,117 +1,362 @@
+import base64
+import hashlib
+import hmac
 import os
-import sys
+import re
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Union
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+import bcrypt
+import jwt
+import orjson
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 from fastapi import HTTPException, status
 from loguru import logger
 import secrets
 
-# Add shared directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-
 from shared.auth_models import (
     UserTable, SessionTable, UserCreate, UserUpdate, UserInDB, 
     TokenData, UserRole, LoginResponse, UserResponse
 )
-from backend.database import get_database_manager
+from backend.database import apply_safe_loading, get_database_manager
+from shared.config import Config
+
+# Error responses for high-rate failure paths. Each raise gets a fresh
+# instance: a shared one raised concurrently from threads would have its
+# __traceback__/__context__ overwritten by the other raises.
+def _invalid_credentials() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def _login_failed() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Incorrect username or password",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def _user_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="User not found"
+    )
+
+# Three base64url segments; anything else is rejected before any decoding
+_JWT_RE = re.compile(r"[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+")
+
+# 2.0-style statements built once; SQLAlchemy caches their compiled form.
+# Full rows are loaded because callers update and cache the returned users.
+# In debug mode a lazy load from these rows raises instead of querying per user.
+_STMT_USER_BY_NAME = apply_safe_loading(select(UserTable).where(UserTable.username == bindparam("username")))
+_STMT_USER_BY_ID = apply_safe_loading(select(UserTable).where(UserTable.id == bindparam("user_id")))
+_STMT_USERS_PAGE = apply_safe_loading(
+    select(UserTable).order_by(UserTable.id).offset(bindparam("skip")).limit(bindparam("limit"))
+)
+
+class _RandomPool:
+    """Hand out CSPRNG bytes from a buffer filled by one large os.urandom call"""
+    
+    def __init__(self, size: int = 65536):
+        self._size = size
+        self._lock = threading.Lock()
+        self._refill()
+        # A forked child must never hand out the same bytes as its parent
+        os.register_at_fork(after_in_child=self._refill)
+    
+    def _refill(self):
+        self._buf = os.urandom(self._size)
+        self._offset = 0
+    
+    def take(self, n: int) -> bytes:
+        """Return n fresh random bytes; each byte is handed out at most once"""
+        with self._lock:
+            if self._offset + n > self._size:
+                self._refill()
+            chunk = self._buf[self._offset:self._offset + n]
+            self._offset += n
+            return chunk
+
+_random_pool = _RandomPool()
+
+# Password hashing: Argon2id for new hashes; legacy bcrypt hashes still
+# verify and are upgraded on the next successful login. Built once per
+# process and shared, so extra AuthService instances are cheap.
+_PASSWORD_HASHER = PasswordHasher(
+    time_cost=Config.ARGON2_TIME_COST,
+    memory_cost=Config.ARGON2_MEMORY_KIB,
+    parallelism=Config.ARGON2_PARALLELISM
+)
+
+def _make_dummy_hash() -> str:
+    """Real hash at the configured cost, so unknown-user logins take as long as real ones"""
+    dummy_hash = _PASSWORD_HASHER.hash(secrets.token_urlsafe(16))
+    # It must be a well-formed hash with the current parameters, or verifying
+    # against it could short-circuit and reintroduce the timing difference
+    try:
+        _PASSWORD_HASHER.verify(dummy_hash, "not-a-real-password")
+    except VerificationError:
+        if dummy_hash.startswith("$argon2id$") and not _PASSWORD_HASHER.check_needs_rehash(dummy_hash):
+            return dummy_hash
+    raise RuntimeError("Dummy password hash self-test failed")
+
+_DUMMY_HASH = _make_dummy_hash()
+
+# Resolved once so every AuthService instance signs with the same key
+_SECRET_KEY = os.getenv("JWT_SECRET_KEY", secrets.token_urlsafe(32))
+if "JWT_SECRET_KEY" not in os.environ:
+    logger.warning("JWT_SECRET_KEY not set in environment. Using auto-generated key.")
+    logger.warning("For production, set JWT_SECRET_KEY environment variable!")
+
+class ActivityRecorder:
+    """Coalesce last_login/last_activity writes and flush them in batches off the request path"""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending: dict[int, tuple[datetime, bool]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def record(self, user_id: int, timestamp: datetime, login: bool = False):
+        """Queue an activity (or login) timestamp for a user"""
+        with self._lock:
+            # Keep the latest timestamp, but never drop a pending login
+            _, pending_login = self._pending.get(user_id, (None, False))
+            self._pending[user_id] = (timestamp, login or pending_login)
+            
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="activity-flush", daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while not self._wakeup.wait(self.interval):
+            self.flush()
+    
+    def flush(self):
+        """Write all pending timestamps in at most two bulk UPDATEs"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        
+        logins = [
+            {"id": user_id, "last_login": ts, "last_activity": ts}
+            for user_id, (ts, login) in pending.items() if login
+        ]
+        activity = [
+            {"id": user_id, "last_activity": ts}
+            for user_id, (ts, login) in pending.items() if not login
+        ]
+        
+        try:
+            with get_database_manager().get_session_context() as db:
+                # Bulk UPDATE by primary key (SQLAlchemy 2.0 executemany form)
+                if logins:
+                    db.execute(update(UserTable), logins)
+                if activity:
+                    db.execute(update(UserTable), activity)
+        except Exception as e:
+            logger.error(f"Failed to flush user activity for {len(pending)} users: {e}")
+            return
+        
+        for user_id in pending:
+            auth_service.invalidate_user_cache(user_id)
+    
+    def stop(self):
+        """Stop the background thread and write anything still pending"""
+        self._wakeup.set()
+        self.flush()
 
 class AuthService:
     def __init__(self):
-        # Password hashing
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        # Process-wide hashing setup and signing key (see module level)
+        self.password_hasher = _PASSWORD_HASHER
+        self._dummy_hash = _DUMMY_HASH
         
         # JWT Configuration
-        self.SECRET_KEY = os.getenv("JWT_SECRET_KEY", self._generate_secret_key())
+        self.SECRET_KEY = _SECRET_KEY
         self.ALGORITHM = "HS256"
+        
+        # Immutable token parts, computed once instead of per token
+        self._secret_bytes = self.SECRET_KEY.encode("utf-8")
+        self._header_b64 = self._b64url(b'{"alg":"HS256","typ":"JWT"}')
         self.ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "480"))  # 8 hours
         
-        # Store secret key warning if auto-generated
-        if "JWT_SECRET_KEY" not in os.environ:
-            logger.warning("JWT_SECRET_KEY not set in environment. Using auto-generated key.")
-            logger.warning("For production, set JWT_SECRET_KEY environment variable!")
-    
-    def _generate_secret_key(self) -> str:
-        """Generate a random secret key"""
-        return secrets.token_urlsafe(32)
+        # Detached user row snapshots by id, plus username -> id, to skip
+        # the SELECT on repeat lookups. Request handlers run in a thread pool.
+        self._user_cache = TTLCache(maxsize=10_000, ttl=Config.USER_CACHE_TTL_SECONDS)
+        self._user_ids = TTLCache(maxsize=10_000, ttl=Config.USER_CACHE_TTL_SECONDS)
+        self._user_cache_lock = threading.RLock()
+        
+        # Recent successful logins: (username, peppered HMAC of password) -> stored hash.
+        # The pepper is process-local, so plaintext-equivalent keys never leave memory.
+        self._login_pepper = secrets.token_bytes(32)
+        self._login_cache = TTLCache(maxsize=10_000, ttl=30)
+        
+        # Batched last_login/last_activity writer
+        self.activity = ActivityRecorder(Config.ACTIVITY_FLUSH_SECONDS)
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
-        return self.pwd_context.verify(plain_password, hashed_password)
+        # Both C implementations release the GIL while hashing
+        try:
+            if hashed_password.startswith("$argon2"):
+                return self.password_hasher.verify(hashed_password, plain_password)
+            return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+        except (VerificationError, InvalidHashError, ValueError):
+            # Wrong password or malformed stored hash
+            return False
     
     def get_password_hash(self, password: str) -> str:
         """Hash a password"""
-        return self.pwd_context.hash(password)
+        return self.password_hasher.hash(password)
+    
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Whether a stored hash is legacy bcrypt or uses outdated Argon2 parameters"""
+        if not hashed_password.startswith("$argon2"):
+            return True
+        try:
+            return self.password_hasher.check_needs_rehash(hashed_password)
+        except InvalidHashError:
+            return True
+    
+    @staticmethod
+    def _b64url(raw: bytes) -> bytes:
+        """Unpadded base64url, as used by JWT"""
+        return base64.urlsafe_b64encode(raw).rstrip(b"=")
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None) -> str:
-        """Create JWT access token"""
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + expires_delta
-        else:
-            expire = datetime.utcnow() + timedelta(minutes=self.ACCESS_TOKEN_EXPIRE_MINUTES)
+        """Create JWT access token (HS256, signed directly with hmac)"""
+        lifetime = expires_delta.total_seconds() if expires_delta else self.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        payload = {**data, "exp": int(time.time() + lifetime)}
         
-        to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
-        return encoded_jwt
+        # orjson emits compact UTF-8 bytes, ready for base64url
+        signing_input = self._header_b64 + b"." + self._b64url(orjson.dumps(payload))
+        signature = hmac.new(self._secret_bytes, signing_input, hashlib.sha256).digest()
+        return (signing_input + b"." + self._b64url(signature)).decode("ascii")
     
     def verify_token(self, token: str) -> TokenData:
         """Verify and decode JWT token"""
+        if not _JWT_RE.fullmatch(token):
+            raise _invalid_credentials()
+        
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            # Signature, algorithm and expiry are checked by PyJWT
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM], options={"require": ["exp"]})
             username: str = payload.get("sub")
             user_id: int = payload.get("user_id")
             
             if username is None or user_id is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid authentication credentials",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
+                raise _invalid_credentials() from None
             
-            return TokenData(username=username, user_id=user_id)
+            return TokenData(username=username, user_id=user_id, exp=payload.get("exp"))
         
-        except JWTError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+        except jwt.InvalidTokenError:
+            raise _invalid_credentials() from None
     
     def get_user_by_username(self, db: Session, username: str) -> Optional[UserTable]:
         """Get user by username"""
-        return db.query(UserTable).filter(UserTable.username == username).first()
-    
-
+        with self._user_cache_lock:
+            user_id = self._user_ids.get(username)
+        if user_id is not None:
+            user = self._get_cached_user(db, user_id)
+            if user is not None:
+                return user
+        
+        user = db.execute(_STMT_USER_BY_NAME, {"username": username}).scalar_one_or_none()
+        if user is not None:
+            self._cache_user(user)
+        return user
     
     def get_user_by_id(self, db: Session, user_id: int) -> Optional[UserTable]:
         """Get user by ID"""
-        return db.query(UserTable).filter(UserTable.id == user_id).first()
+        user = self._get_cached_user(db, user_id)
+        if user is not None:
+            return user
+        
+        user = db.execute(_STMT_USER_BY_ID, {"user_id": user_id}).scalar_one_or_none()
+        if user is not None:
+            self._cache_user(user)
+        return user
+    
+    def _get_cached_user(self, db: Session, user_id: int) -> Optional[UserTable]:
+        """Attach a cached snapshot to this session without querying the database"""
+        with self._user_cache_lock:
+            snapshot = self._user_cache.get(user_id)
+        if snapshot is None:
+            return None
+        # load=False copies the cached state in; changes still flush as normal UPDATEs
+        return db.merge(snapshot, load=False)
+    
+    def _cache_user(self, user: UserTable):
+        """Store a detached copy of a loaded user row"""
+        snapshot = UserTable(**{column.key: getattr(user, column.key) for column in UserTable.__table__.columns})
+        make_transient_to_detached(snapshot)
+        with self._user_cache_lock:
+            self._user_cache[user.id] = snapshot
+            self._user_ids[user.username] = user.id
+    
+    def invalidate_user_cache(self, user_id: int, username: Optional[str] = None):
+        """Drop cached rows for a user after it has been modified"""
+        with self._user_cache_lock:
+            snapshot = self._user_cache.pop(user_id, None)
+            if snapshot is not None:
+                self._user_ids.pop(snapshot.username, None)
+            if username is not None:
+                self._user_ids.pop(username, None)
     
     def authenticate_user(self, db: Session, username: str, password: str) -> Union[UserTable, bool]:
         """Authenticate user with username/password"""
         user = self.get_user_by_username(db, username)
         
+        login_key = (username, hmac.new(self._login_pepper, password.encode("utf-8"), hashlib.sha256).digest())
+        with self._user_cache_lock:
+            cached_hash = self._login_cache.get(login_key)
+        
         # SECURITY FIX: Prevent timing attacks by always performing password verification
         # Use a dummy hash if user doesn't exist to maintain consistent timing
-        if user:
+        if user and cached_hash is not None and hmac.compare_digest(cached_hash, user.hashed_password):
+            # Same correct password seen recently and the stored hash is unchanged,
+            # so hashing can be skipped. Wrong passwords never hit this branch.
+            password_valid = True
+        elif user:
             password_valid = self.verify_password(password, user.hashed_password)
+            if password_valid and user.is_active and self.needs_rehash(user.hashed_password):
+                # Upgrade to Argon2id; the caller's commit (login) persists it
+                new_hash = self.get_password_hash(password)
+                db.execute(
+                    update(UserTable).where(UserTable.id == user.id).values(hashed_password=new_hash)
+                )
+                self.invalidate_user_cache(user.id, user.username)
+                set_committed_value(user, "hashed_password", new_hash)
+            if password_valid:
+                with self._user_cache_lock:
+                    self._login_cache[login_key] = user.hashed_password
         else:
-            # Use a dummy bcrypt hash to maintain consistent timing
-            from shared.config import Config
-            self.verify_password(password, Config.DUMMY_PASSWORD_HASH)
+            # Use a dummy hash to maintain consistent timing
+            self.verify_password(password, self._dummy_hash)
             password_valid = False
         
         # Return False if user doesn't exist, password is wrong, or user is inactive
         if not user or not password_valid or not user.is_active:
             return False
         
-        # Update last login only if authentication successful
-        user.last_login = datetime.utcnow()
-        user.last_activity = datetime.utcnow()
-        db.commit()
+        # Update last login only if authentication successful. The write is
+        # batched in the background; the detached instance shows the new value.
+        now = datetime.utcnow()
+        db.expunge(user)
+        user.last_login = now
+        user.last_activity = now
+        self.activity.record(user.id, now, login=True)
         
         return user
     
@@ -122,18 +367,17 @@ class AuthService:
         if existing_user:
             # If user exists but is inactive, reactivate and update it
             if not existing_user.is_active:
-                logger.info(f"Reactivating inactive user: {user.username}")
+                logger.info("Reactivating inactive user: {}", user.username)
                 existing_user.is_active = True
                 existing_user.hashed_password = self.get_password_hash(user.password)
                 existing_user.full_name = user.full_name
                 existing_user.role = user.role.value
                 existing_user.avatar_color = user.avatar_color
                 existing_user.is_kid_account = user.is_kid_account
-                existing_user.last_activity = datetime.utcnow()
                 db.commit()
-                db.refresh(existing_user)
+                self.invalidate_user_cache(existing_user.id, existing_user.username)
                 
-                logger.info(f"Reactivated user: {user.username}")
+                logger.info("Reactivated user: {}", user.username)
                 return existing_user
             else:
                 # User exists and is active
@@ -155,19 +399,16 @@ class AuthService:
         
         db.add(db_user)
         db.commit()
-        db.refresh(db_user)
+        self.invalidate_user_cache(db_user.id, db_user.username)
         
-        logger.info(f"Created new user: {user.username}")
+        logger.info("Created new user: {}", user.username)
         return db_user
     
     def update_user(self, db: Session, user_id: int, user_update: UserUpdate) -> UserTable:
         """Update user information"""
         user = self.get_user_by_id(db, user_id)
         if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
+            raise _user_not_found()
         
         # Update fields if provided
         if user_update.full_name is not None:
@@ -185,21 +426,17 @@ class AuthService:
         if user_update.is_kid_account is not None:
             user.is_kid_account = user_update.is_kid_account
         
-        user.last_activity = datetime.utcnow()
         db.commit()
-        db.refresh(user)
+        self.invalidate_user_cache(user.id, user.username)
         
-        logger.info(f"Updated user: {user.username}")
+        logger.info("Updated user: {}", user.username)
         return user
     
     def change_password(self, db: Session, user_id: int, current_password: str, new_password: str) -> bool:
         """Change user password"""
         user = self.get_user_by_id(db, user_id)
         if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
+            raise _user_not_found()
         
         if not self.verify_password(current_password, user.hashed_password):
             raise HTTPException(
@@ -208,31 +445,28 @@ class AuthService:
             )
         
         user.hashed_password = self.get_password_hash(new_password)
-        user.last_activity = datetime.utcnow()
         db.commit()
+        self.invalidate_user_cache(user.id, user.username)
         
-        logger.info(f"Password changed for user: {user.username}")
+        logger.info("Password changed for user: {}", user.username)
         return True
     
     def delete_user(self, db: Session, user_id: int) -> bool:
         """Delete user (soft delete by deactivating)"""
         user = self.get_user_by_id(db, user_id)
         if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
+            raise _user_not_found()
         
         user.is_active = False
-        user.last_activity = datetime.utcnow()
         db.commit()
+        self.invalidate_user_cache(user.id, user.username)
         
-        logger.info(f"Deactivated user: {user.username}")
+        logger.info("Deactivated user: {}", user.username)
         return True
     
     def get_all_users(self, db: Session, skip: int = 0, limit: int = 100) -> list[UserTable]:
         """Get all users (admin only)"""
-        return db.query(UserTable).offset(skip).limit(limit).all()
+        return list(db.execute(_STMT_USERS_PAGE, {"skip": skip, "limit": limit}).scalars())
     
     def create_admin_user(self, db: Session, username: str, password: str, full_name: str = None) -> UserTable:
         """Create admin user"""
@@ -250,11 +484,10 @@ class AuthService:
         """Login user and return token"""
         user = self.authenticate_user(db, username, password)
         if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+            raise _login_failed()
+        
+        # authenticate_user just stamped last_login; reuse it rather than reading the clock again
+        now = user.last_login
         
         # Create access token
         access_token_expires = timedelta(minutes=self.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -263,14 +496,14 @@ class AuthService:
             expires_delta=access_token_expires
         )
         
-        # Create session record
-        session_token = secrets.token_urlsafe(32)
-        session = SessionTable(
+        # Create session record with a single Core INSERT (nothing reads the row back).
+        # last_login/last_activity are batched by ActivityRecorder, so this is the
+        # only write, and the only commit, on the login path.
+        db.execute(insert(SessionTable).values(
             user_id=user.id,
-            session_token=session_token,
-            expires_at=datetime.utcnow() + access_token_expires
-        )
-        db.add(session)
+            session_token=base64.urlsafe_b64encode(_random_pool.take(32)).rstrip(b"=").decode("ascii"),
+            expires_at=now + access_token_expires
+        ))
         db.commit()
         
         return LoginResponse(
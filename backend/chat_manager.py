@@ -1,22 +1,111 @@
 import json
+import re
 import asyncio
+import functools
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+import orjson
 import redis.asyncio as redis
+from cachetools import TTLCache
 from loguru import logger
-import sys
-import os
-
-# Add shared directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from shared.models import ChatMessage, ChatRoom, MessageType
 from shared.config import Config, RedisKeys
 
 
+def _message_fields(message: ChatMessage) -> Dict[str, Any]:
+    """Serializable fields of a message, with metadata left as a native dict"""
+    return {
+        "message_id": message.message_id,
+        "chat_room_id": message.chat_room_id,
+        "sender_id": message.sender_id,
+        "sender_name": message.sender_name,
+        "content": message.content,
+        "message_type": message.message_type.value,
+        # Integer unix milliseconds: compact, and cheap to encode and decode
+        "ts_ms": int(message.timestamp.timestamp() * 1000),
+        "metadata": message.metadata
+    }
+
+
+_GLOB_SPECIAL_RE = re.compile(r'([\\*?\[\]])')
+
+
+def _decode_message(raw_msg: bytes) -> ChatMessage:
+    """Parse a sorted-set member back into a ChatMessage"""
+    msg_data = orjson.loads(raw_msg)
+    metadata = msg_data["metadata"]
+    if isinstance(metadata, str):
+        # Legacy records carry metadata as a JSON string inside the JSON
+        metadata = orjson.loads(metadata)
+    return ChatMessage(
+        message_id=msg_data["message_id"],
+        chat_room_id=msg_data["chat_room_id"],
+        sender_id=msg_data["sender_id"],
+        sender_name=msg_data["sender_name"],
+        content=msg_data["content"],
+        message_type=MessageType(msg_data["message_type"]),
+        timestamp=(
+            datetime.fromtimestamp(msg_data["ts_ms"] / 1000) if "ts_ms" in msg_data
+            # Legacy records carry an ISO timestamp string
+            else datetime.fromisoformat(msg_data["timestamp"])
+        ),
+        metadata=metadata
+    )
+
+
+# Message storage: the room's sorted set holds message ids scored by time and
+# the payloads hash maps each id to its JSON. KEYS are {sorted set, payloads}.
+
+# ARGV: score, message_id, payload, max history
+_STORE_MESSAGE_LUA = """
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+local overflow = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[4])
+if overflow > 0 then
+    local dropped = redis.call('ZRANGE', KEYS[1], 0, overflow - 1)
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, overflow - 1)
+    redis.call('HDEL', KEYS[2], unpack(dropped))
+end
+"""
+
+# ARGV: limit. Newest first; members written before the payloads hash existed
+# are the JSON themselves and are returned as is.
+_RECENT_MESSAGES_LUA = """
+local ids = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #ids == 0 then return {} end
+local payloads = redis.call('HMGET', KEYS[2], unpack(ids))
+for i, id in ipairs(ids) do
+    if not payloads[i] then payloads[i] = id end
+end
+return payloads
+"""
+
+# ARGV: cutoff score. Returns the number of messages removed.
+_EXPIRE_MESSAGES_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+for i = 1, #ids, 500 do
+    redis.call('HDEL', KEYS[2], unpack(ids, i, math.min(i + 499, #ids)))
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+return #ids
+"""
+
+
 class ChatManager:
     def __init__(self, redis_client: redis.Redis):
         self.redis = redis_client
+        # Whether rooms created before the room index existed have been added to it
+        self._room_index_backfilled = False
+        # Rooms change rarely; keep parsed copies to skip Redis on listings and
+        # access checks. Writes here refresh it; other processes' writes show up
+        # once the entry expires.
+        self._room_cache = TTLCache(maxsize=10_000, ttl=Config.ROOM_CACHE_TTL_SECONDS)
+        # In-flight Redis loads by room id, shared by concurrent cache misses
+        self._room_loads: Dict[str, asyncio.Future] = {}
+        self._store_message_script = self.redis.register_script(_STORE_MESSAGE_LUA)
+        self._recent_messages_script = self.redis.register_script(_RECENT_MESSAGES_LUA)
+        self._expire_messages_script = self.redis.register_script(_EXPIRE_MESSAGES_LUA)
     
     async def create_room(self, room_id: str, room_name: str, description: str = None, ai_system_prompt: str = None, ai_model: str = None, created_by: str = None, voice_readback_enabled: bool = False, voice_id: str = "N2lVS1w4EtoT3dr4eOWO", is_private: bool = False, assigned_users: List[str] = None) -> ChatRoom:
         """Create a new chat room"""
@@ -38,34 +127,100 @@ class ChatManager:
         )
         
         # Store room info in Redis
-        room_key = f"chat:room:{room_id}"
-        await self.redis.hset(room_key, mapping={
-            "room_id": room_id,
-            "room_name": room_name,
-            "description": description or "",
-            "created_at": chat_room.created_at.isoformat(),
-            "ai_enabled": str(chat_room.ai_enabled),
-            "ai_personality": chat_room.ai_personality,
-            "ai_system_prompt": ai_system_prompt or "",
-            "ai_model": ai_model or "",
-            "created_by": created_by or "",
-            "voice_readback_enabled": str(voice_readback_enabled),
-            "voice_id": voice_id,
-            "is_private": str(is_private),
-            "assigned_users": json.dumps(assigned_users)
-        })
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._write_room(pipe, chat_room)
+            pipe.sadd(RedisKeys.ROOM_INDEX, room_id)
+            await pipe.execute()
+        self._cache_room(room_id, chat_room.model_copy(deep=True))
         
         logger.info(f"Created chat room: {room_name} ({room_id}) - Private: {is_private}")
         return chat_room
     
     async def get_room(self, room_id: str) -> Optional[ChatRoom]:
         """Get chat room info"""
+        cached = self._room_cache.get(room_id)
+        if cached is None:
+            # Concurrent misses for a room share a single Redis load
+            load = self._room_loads.get(room_id)
+            if load is None:
+                load = asyncio.ensure_future(self._fetch_room(room_id))
+                self._room_loads[room_id] = load
+                load.add_done_callback(functools.partial(self._room_load_done, room_id))
+            cached = await asyncio.shield(load)
+            if cached is None:
+                return None
+        
+        # Callers mutate the returned room, so never hand out the cached instance
+        return cached.model_copy(deep=True)
+    
+    async def _fetch_room(self, room_id: str) -> Optional[ChatRoom]:
+        """Load a room from Redis, bypassing the cache"""
         room_key = f"chat:room:{room_id}"
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(room_key)
+                pipe.smembers(RedisKeys.ROOM_ASSIGNED_USERS.format(room_id=room_id))
+                room_blob, assigned_users = await pipe.execute()
+        except redis.ResponseError:
+            # WRONGTYPE: still stored in the legacy hash layout
+            return await self._migrate_legacy_room(room_key)
+        return self._load_room(room_blob, assigned_users) if room_blob is not None else None
+    
+    def _room_load_done(self, room_id: str, load: asyncio.Future):
+        """Cache the result of a finished load unless a write to the room superseded it"""
+        if self._room_loads.get(room_id) is not load:
+            return
+        del self._room_loads[room_id]
+        if not load.cancelled() and load.exception() is None and load.result() is not None:
+            self._room_cache[room_id] = load.result()
+    
+    def _cache_room(self, room_id: str, room: Optional[ChatRoom]):
+        """Replace (or with None, drop) a room's cache entry after writing it"""
+        # A load still in flight may have read the room before this write
+        self._room_loads.pop(room_id, None)
+        if room is None:
+            self._room_cache.pop(room_id, None)
+        else:
+            self._room_cache[room_id] = room
+    
+    @staticmethod
+    def _room_blob(room: ChatRoom) -> str:
+        """Serialize a room into the single JSON value stored at chat:room:{room_id}"""
+        # Active and assigned users are tracked in their own sets, not with the room
+        return room.model_dump_json(exclude={"active_users", "assigned_users"})
+    
+    def _write_room(self, pipe, room: ChatRoom, assigned_users_changed: bool = True):
+        """Queue the writes storing a room on a (transactional) pipeline"""
+        pipe.set(f"chat:room:{room.room_id}", self._room_blob(room))
+        if assigned_users_changed:
+            assigned_key = RedisKeys.ROOM_ASSIGNED_USERS.format(room_id=room.room_id)
+            pipe.delete(assigned_key)
+            if room.assigned_users:
+                pipe.sadd(assigned_key, *room.assigned_users)
+    
+    @staticmethod
+    def _load_room(room_blob: bytes, assigned_users: set) -> ChatRoom:
+        """Parse a stored room value and attach its assigned users"""
+        room = ChatRoom.model_validate_json(room_blob)
+        room.assigned_users = [user_id.decode() for user_id in assigned_users]
+        return room
+    
+    async def _migrate_legacy_room(self, room_key: str) -> Optional[ChatRoom]:
+        """Read a room stored as a hash of fields and rewrite it as a single value"""
         room_data = await self.redis.hgetall(room_key)
-        
         if not room_data:
             return None
         
+        room = self._room_from_hash(room_data)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(room_key)
+            self._write_room(pipe, room)
+            await pipe.execute()
+        return room
+    
+    @staticmethod
+    def _room_from_hash(room_data: Dict[bytes, bytes]) -> ChatRoom:
+        """Build a ChatRoom from its legacy Redis hash"""
         return ChatRoom(
             room_id=room_data[b"room_id"].decode(),
             room_name=room_data[b"room_name"].decode(),
@@ -109,22 +264,10 @@ class ChatManager:
                 room.assigned_users = assigned_users
             
             # Save updated room to Redis
-            room_key = f"chat:room:{room_id}"
-            await self.redis.hset(room_key, mapping={
-                "room_id": room.room_id,
-                "room_name": room.room_name,
-                "description": room.description or "",
-                "created_at": room.created_at.isoformat(),
-                "ai_enabled": str(room.ai_enabled),
-                "ai_personality": room.ai_personality,
-                "ai_system_prompt": room.ai_system_prompt or "",
-                "ai_model": room.ai_model or "",
-                "created_by": room.created_by or "",
-                "voice_readback_enabled": str(room.voice_readback_enabled),
-                "voice_id": room.voice_id,
-                "is_private": str(room.is_private),
-                "assigned_users": json.dumps(room.assigned_users)
-            })
+            async with self.redis.pipeline(transaction=True) as pipe:
+                self._write_room(pipe, room, assigned_users_changed=assigned_users is not None)
+                await pipe.execute()
+            self._cache_room(room_id, room.model_copy(deep=True))
             
             logger.info(f"Updated chat room: {room.room_name} ({room_id})")
             return room
@@ -136,24 +279,36 @@ class ChatManager:
     async def delete_room(self, room_id: str) -> bool:
         """Delete a chat room and all its messages"""
         try:
-            # Remove room data
+            # Remove room data, all messages for this room, room users and
+            # assigned users in one DEL
             room_key = f"chat:room:{room_id}"
-            await self.redis.delete(room_key)
-            
-            # Remove all messages for this room
+            assigned_key = RedisKeys.ROOM_ASSIGNED_USERS.format(room_id=room_id)
             messages_key = RedisKeys.CHAT_MESSAGES.format(room_id=room_id)
-            await self.redis.delete(messages_key)
-            
-            # Remove room users
+            payloads_key = RedisKeys.MESSAGE_PAYLOADS.format(room_id=room_id)
             users_key = RedisKeys.ROOM_USERS.format(room_id=room_id)
-            await self.redis.delete(users_key)
+            # Per-message lookup keys are no longer written; remove any left by
+            # older versions, found via the JSON members their sorted set held
+            message_ids = set()
+            for raw_msg in await self.redis.zrange(messages_key, 0, -1):
+                if not raw_msg.startswith(b"{"):
+                    continue
+                try:
+                    message_ids.add(orjson.loads(raw_msg)["message_id"])
+                except (orjson.JSONDecodeError, KeyError):
+                    continue
             
-            # Remove individual message keys (cleanup)
-            message_keys = await self.redis.keys(f"chat:message:*")
-            for msg_key in message_keys:
-                msg_data = await self.redis.hgetall(msg_key)
-                if msg_data and msg_data.get(b"chat_room_id", b"").decode() == room_id:
-                    await self.redis.delete(msg_key)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(room_key, assigned_key, messages_key, payloads_key, users_key)
+                pipe.srem(RedisKeys.ROOM_INDEX, room_id)
+                await pipe.execute()
+            self._cache_room(room_id, None)
+            
+            # Remove legacy individual message keys, in bounded batches
+            msg_keys = [f"chat:message:{message_id}" for message_id in message_ids]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for start in range(0, len(msg_keys), 500):
+                    pipe.delete(*msg_keys[start:start + 500])
+                await pipe.execute()
             
             logger.info(f"Deleted chat room: {room_id}")
             return True
@@ -165,30 +320,19 @@ class ChatManager:
     async def store_message(self, message: ChatMessage) -> bool:
         """Store a chat message in Redis"""
         try:
-            # Store in message list for the room
             messages_key = RedisKeys.CHAT_MESSAGES.format(room_id=message.chat_room_id)
-            message_data = {
-                "message_id": message.message_id,
-                "chat_room_id": message.chat_room_id,
-                "sender_id": message.sender_id,
-                "sender_name": message.sender_name,
-                "content": message.content,
-                "message_type": message.message_type.value,
-                "timestamp": message.timestamp.isoformat(),
-                "metadata": json.dumps(message.metadata)
-            }
-            
-            # Add to sorted set with timestamp as score for chronological ordering
-            timestamp_score = message.timestamp.timestamp()
-            await self.redis.zadd(messages_key, {json.dumps(message_data): timestamp_score})
+            payloads_key = RedisKeys.MESSAGE_PAYLOADS.format(room_id=message.chat_room_id)
             
-            # Trim old messages to maintain max history
-            await self.redis.zremrangebyrank(messages_key, 0, -(Config.MAX_CHAT_HISTORY + 1))
+            message_data = _message_fields(message)
             
-            # Store individual message for quick lookup
-            msg_key = f"chat:message:{message.message_id}"
-            await self.redis.hset(msg_key, mapping=message_data)
-            await self.redis.expire(msg_key, 86400 * 7)  # Expire after 7 days
+            # Index the id by timestamp (in seconds) for chronological ordering,
+            # store the payload under the id and trim old messages to maintain
+            # max history, atomically in one round trip
+            await self._store_message_script(
+                keys=[messages_key, payloads_key],
+                args=[message_data["ts_ms"] / 1000, message.message_id,
+                      orjson.dumps(message_data), Config.MAX_CHAT_HISTORY]
+            )
             
             logger.debug(f"Stored message {message.message_id} in room {message.chat_room_id}")
             return True
@@ -201,26 +345,18 @@ class ChatManager:
         """Get recent messages for a room"""
         try:
             messages_key = RedisKeys.CHAT_MESSAGES.format(room_id=room_id)
+            payloads_key = RedisKeys.MESSAGE_PAYLOADS.format(room_id=room_id)
             
-            # Get recent messages from sorted set (highest scores = most recent)
-            raw_messages = await self.redis.zrevrange(messages_key, 0, limit - 1)
+            # Get payloads of the most recent ids (highest scores) in one round trip
+            raw_messages = await self._recent_messages_script(
+                keys=[messages_key, payloads_key], args=[limit]
+            )
             
             messages = []
             for raw_msg in raw_messages:
                 try:
-                    msg_data = json.loads(raw_msg.decode())
-                    message = ChatMessage(
-                        message_id=msg_data["message_id"],
-                        chat_room_id=msg_data["chat_room_id"],
-                        sender_id=msg_data["sender_id"],
-                        sender_name=msg_data["sender_name"],
-                        content=msg_data["content"],
-                        message_type=MessageType(msg_data["message_type"]),
-                        timestamp=datetime.fromisoformat(msg_data["timestamp"]),
-                        metadata=json.loads(msg_data["metadata"])
-                    )
-                    messages.append(message)
-                except (json.JSONDecodeError, KeyError, ValueError) as e:
+                    messages.append(_decode_message(raw_msg))
+                except (orjson.JSONDecodeError, KeyError, ValueError) as e:
                     logger.warning(f"Skipping malformed message: {e}")
                     continue
             
@@ -232,25 +368,57 @@ class ChatManager:
             logger.error(f"Error retrieving messages for room {room_id}: {e}")
             return []
     
-    async def get_message(self, message_id: str) -> Optional[ChatMessage]:
-        """Get a specific message by ID"""
+    async def get_last_messages_bulk(self, room_ids: List[str]) -> Dict[str, ChatMessage]:
+        """Most recent message of each room, for rooms that have one, in one round trip"""
+        if not room_ids:
+            return {}
         try:
-            msg_key = f"chat:message:{message_id}"
-            msg_data = await self.redis.hgetall(msg_key)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for room_id in room_ids:
+                    await self._recent_messages_script(
+                        keys=[
+                            RedisKeys.CHAT_MESSAGES.format(room_id=room_id),
+                            RedisKeys.MESSAGE_PAYLOADS.format(room_id=room_id)
+                        ],
+                        args=[1],
+                        client=pipe
+                    )
+                results = await pipe.execute()
             
-            if not msg_data:
-                return None
+            last_messages = {}
+            for room_id, raw_messages in zip(room_ids, results):
+                if not raw_messages:
+                    continue
+                try:
+                    last_messages[room_id] = _decode_message(raw_messages[0])
+                except (orjson.JSONDecodeError, KeyError, ValueError) as e:
+                    logger.warning(f"Skipping malformed message: {e}")
+            return last_messages
             
-            return ChatMessage(
-                message_id=msg_data[b"message_id"].decode(),
-                chat_room_id=msg_data[b"chat_room_id"].decode(),
-                sender_id=msg_data[b"sender_id"].decode(),
-                sender_name=msg_data[b"sender_name"].decode(),
-                content=msg_data[b"content"].decode(),
-                message_type=MessageType(msg_data[b"message_type"].decode()),
-                timestamp=datetime.fromisoformat(msg_data[b"timestamp"].decode()),
-                metadata=json.loads(msg_data[b"metadata"].decode())
-            )
+        except Exception as e:
+            logger.error(f"Error retrieving last messages: {e}")
+            return {}
+    
+    async def _find_message_member(self, room_id: str, message_id: str) -> Optional[bytes]:
+        """Legacy JSON sorted-set member of a message, scanning the room's bounded history"""
+        messages_key = RedisKeys.CHAT_MESSAGES.format(room_id=room_id)
+        # Both the orjson and the older json.dumps encodings contain the quoted id
+        quoted_id = _GLOB_SPECIAL_RE.sub(r'\\\1', orjson.dumps(message_id).decode())
+        async for raw_msg, _ in self.redis.zscan_iter(messages_key, match=f"*{quoted_id}*"):
+            try:
+                if orjson.loads(raw_msg)["message_id"] == message_id:
+                    return raw_msg
+            except (orjson.JSONDecodeError, KeyError):
+                continue
+        return None
+    
+    async def get_message(self, message_id: str, room_id: str) -> Optional[ChatMessage]:
+        """Get a specific message by ID"""
+        try:
+            raw_msg = await self.redis.hget(RedisKeys.MESSAGE_PAYLOADS.format(room_id=room_id), message_id)
+            if raw_msg is None:
+                raw_msg = await self._find_message_member(room_id, message_id)
+            return _decode_message(raw_msg) if raw_msg is not None else None
             
         except Exception as e:
             logger.error(f"Error retrieving message {message_id}: {e}")
@@ -259,28 +427,20 @@ class ChatManager:
     async def delete_message(self, message_id: str, room_id: str) -> bool:
         """Delete a message"""
         try:
-            # Get the message first to find its data for removal from sorted set
-            message = await self.get_message(message_id)
-            if not message:
-                return False
-            
-            # Remove from sorted set
             messages_key = RedisKeys.CHAT_MESSAGES.format(room_id=room_id)
-            message_data = {
-                "message_id": message.message_id,
-                "chat_room_id": message.chat_room_id,
-                "sender_id": message.sender_id,
-                "sender_name": message.sender_name,
-                "content": message.content,
-                "message_type": message.message_type.value,
-                "timestamp": message.timestamp.isoformat(),
-                "metadata": json.dumps(message.metadata)
-            }
-            await self.redis.zrem(messages_key, json.dumps(message_data))
-            
-            # Remove individual message
-            msg_key = f"chat:message:{message_id}"
-            await self.redis.delete(msg_key)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zrem(messages_key, message_id)
+                pipe.hdel(RedisKeys.MESSAGE_PAYLOADS.format(room_id=room_id), message_id)
+                # Lookup key from older versions, if any
+                pipe.delete(f"chat:message:{message_id}")
+                removed, _, _ = await pipe.execute()
+            
+            if not removed:
+                # Stored before members were ids: remove the JSON member itself
+                raw_msg = await self._find_message_member(room_id, message_id)
+                if raw_msg is None:
+                    return False
+                await self.redis.zrem(messages_key, raw_msg)
             
             logger.info(f"Deleted message {message_id} from room {room_id}")
             return True
@@ -292,22 +452,24 @@ class ChatManager:
     async def clear_room_messages(self, room_id: str) -> bool:
         """Clear all messages from a room while keeping the room intact"""
         try:
-            # Get all messages to remove individual message keys
+            # Get all messages to remove legacy individual message keys
             messages_key = RedisKeys.CHAT_MESSAGES.format(room_id=room_id)
             raw_messages = await self.redis.zrange(messages_key, 0, -1)
             
-            # Remove individual message keys
+            doomed_keys = [messages_key, RedisKeys.MESSAGE_PAYLOADS.format(room_id=room_id)]
             for raw_msg in raw_messages:
+                if not raw_msg.startswith(b"{"):
+                    # Plain message id; its payload goes with the hash
+                    continue
                 try:
-                    msg_data = json.loads(raw_msg.decode())
-                    msg_key = f"chat:message:{msg_data['message_id']}"
-                    await self.redis.delete(msg_key)
-                except (json.JSONDecodeError, KeyError) as e:
+                    doomed_keys.append(f"chat:message:{orjson.loads(raw_msg)['message_id']}")
+                except (orjson.JSONDecodeError, KeyError) as e:
                     logger.warning(f"Skipping malformed message during cleanup: {e}")
                     continue
             
-            # Remove the sorted set containing all messages for this room
-            await self.redis.delete(messages_key)
+            # Remove the sorted set of this room's messages, their payloads and
+            # legacy lookup keys in one DEL
+            await self.redis.delete(*doomed_keys)
             
             logger.info(f"Cleared all messages from room {room_id}")
             return True
@@ -328,35 +490,53 @@ class ChatManager:
     
     async def add_user_to_room(self, user_id: str, room_id: str) -> bool:
         """Add user to room"""
+        return await self.bulk_add_users(room_id, [user_id])
+    
+    async def bulk_add_users(self, room_id: str, user_ids: List[str]) -> bool:
+        """Add several users to a room in one round trip"""
+        if not user_ids:
+            return True
         try:
             users_key = RedisKeys.ROOM_USERS.format(room_id=room_id)
-            await self.redis.sadd(users_key, user_id)
+            now = datetime.now()
+            last_seen = now.isoformat()
+            expire_at = int(now.timestamp()) + 86400  # Expire after 24 hours
             
-            # Set user status
-            status_key = RedisKeys.USER_STATUS.format(user_id=user_id)
-            await self.redis.hset(status_key, mapping={
-                "user_id": user_id,
-                "room_id": room_id,
-                "status": "online",
-                "last_seen": datetime.now().isoformat()
-            })
-            await self.redis.expire(status_key, 86400)  # Expire after 24 hours
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.sadd(users_key, *user_ids)
+                
+                # Set user status
+                for user_id in user_ids:
+                    status_key = RedisKeys.USER_STATUS.format(user_id=user_id)
+                    pipe.hset(status_key, mapping={
+                        "user_id": user_id,
+                        "room_id": room_id,
+                        "status": "online",
+                        "last_seen": last_seen
+                    })
+                    pipe.expireat(status_key, expire_at)
+                await pipe.execute()
             
             return True
         except Exception as e:
-            logger.error(f"Error adding user {user_id} to room {room_id}: {e}")
+            logger.error(f"Error adding users {user_ids} to room {room_id}: {e}")
             return False
     
     async def remove_user_from_room(self, user_id: str, room_id: str) -> bool:
         """Remove user from room"""
         try:
             users_key = RedisKeys.ROOM_USERS.format(room_id=room_id)
-            await self.redis.srem(users_key, user_id)
-            
-            # Update user status
             status_key = RedisKeys.USER_STATUS.format(user_id=user_id)
-            await self.redis.hset(status_key, "status", "offline")
-            await self.redis.hset(status_key, "last_seen", datetime.now().isoformat())
+            
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.srem(users_key, user_id)
+                
+                # Update user status
+                pipe.hset(status_key, mapping={
+                    "status": "offline",
+                    "last_seen": datetime.now().isoformat()
+                })
+                await pipe.execute()
             
             return True
         except Exception as e:
@@ -371,13 +551,19 @@ class ChatManager:
             cutoff_timestamp = cutoff_time.timestamp()
             
             # Find all message keys
-            message_keys = []
-            async for key in self.redis.scan_iter(match="chat:messages:*"):
-                message_keys.append(key.decode())
-            
-            # Clean old messages from each room
-            for key in message_keys:
-                await self.redis.zremrangebyscore(key, 0, cutoff_timestamp)
+            message_keys = [key async for key in self.redis.scan_iter(match="chat:messages:*")]
+            
+            # Clean old messages from each room, pipelined in bounded batches
+            for start in range(0, len(message_keys), 1000):
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key in message_keys[start:start + 1000]:
+                        room_id = key.decode().split(":", 2)[2]
+                        await self._expire_messages_script(
+                            keys=[key, RedisKeys.MESSAGE_PAYLOADS.format(room_id=room_id)],
+                            args=[cutoff_timestamp],
+                            client=pipe
+                        )
+                    await pipe.execute()
             
             logger.info("Completed cleanup of expired chat data")
             
@@ -417,6 +603,30 @@ class ChatManager:
     
     async def can_user_access_room(self, room: ChatRoom, user_id: str, user_role: str, is_kid: bool) -> bool:
         """Check if a user can access a specific room"""
+        can_access = self._access_without_assignment(room, user_role, is_kid)
+        if can_access is not None:
+            return can_access
+        
+        # Otherwise the user must be assigned
+        return await self._is_assigned(room.room_id, user_id)
+    
+    async def get_room_with_access(self, room_id: str, user_id: str, user_role: str, is_kid: bool) -> Tuple[Optional[ChatRoom], bool]:
+        """Get a room and whether a user can access it, in at most one Redis round trip"""
+        was_cached = room_id in self._room_cache
+        room = await self.get_room(room_id)
+        if room is None:
+            return None, False
+        
+        can_access = self._access_without_assignment(room, user_role, is_kid)
+        if can_access is None:
+            # A room just loaded from Redis carries its current assigned users;
+            # a cached copy may predate another process's assignment change
+            can_access = await self._is_assigned(room_id, user_id) if was_cached else user_id in room.assigned_users
+        return room, can_access
+    
+    @staticmethod
+    def _access_without_assignment(room: ChatRoom, user_role: str, is_kid: bool) -> Optional[bool]:
+        """Access decided by role and room alone, or None if it depends on assignment"""
         # Admins can access any room
         if user_role == "admin":
             return True
@@ -425,32 +635,60 @@ class ChatManager:
         # 1. The general room (safe landing area for all users)
         # 2. Any rooms they've been explicitly assigned to
         if is_kid:
-            if room.room_id == "general":
-                return True
-            return user_id in room.assigned_users
+            return True if room.room_id == "general" else None
         
         # Regular (non-kid) users can access all non-private rooms
         # plus any private rooms they're assigned to
-        if not room.is_private:
-            return True
-        
-        # For private rooms, user must be assigned
-        return user_id in room.assigned_users
+        return True if not room.is_private else None
+    
+    async def _is_assigned(self, room_id: str, user_id: str) -> bool:
+        """Whether a user is assigned to a room, checked against Redis rather than a cached room"""
+        return bool(await self.redis.sismember(RedisKeys.ROOM_ASSIGNED_USERS.format(room_id=room_id), user_id))
     
     async def get_accessible_rooms(self, user_id: str, user_role: str, is_kid: bool) -> List[ChatRoom]:
         """Get all rooms that a user can access"""
-        # Get all room keys
-        room_keys = await self.redis.keys("chat:room:*")
+        # Get all room ids from the index, then every uncached room in one MGET
+        room_ids = await self._get_room_ids()
+        rooms = {}
+        for room_id in room_ids:
+            cached = self._room_cache.get(room_id)
+            rooms[room_id] = cached.model_copy(deep=True) if cached is not None else None
+        missing_ids = [room_id for room_id, room in rooms.items() if room is None]
+        if missing_ids:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.mget([f"chat:room:{room_id}" for room_id in missing_ids])
+                for room_id in missing_ids:
+                    pipe.smembers(RedisKeys.ROOM_ASSIGNED_USERS.format(room_id=room_id))
+                room_blobs, *assigned_sets = await pipe.execute()
+            for room_id, room_blob, assigned_users in zip(missing_ids, room_blobs, assigned_sets):
+                if room_blob is not None:
+                    rooms[room_id] = self._load_room(room_blob, assigned_users)
+                    self._room_cache[room_id] = rooms[room_id].model_copy(deep=True)
+                else:
+                    # MGET returns nil for legacy hash-layout rooms (get_room migrates
+                    # them) and for stale index entries of rooms deleted elsewhere
+                    rooms[room_id] = await self.get_room(room_id)
         accessible_rooms = []
         
         logger.info(f"Filtering rooms for user {user_id} - role: {user_role}, is_kid: {is_kid}")
         
-        for room_key in room_keys:
-            room_id = room_key.decode().split(":")[-1]
-            room = await self.get_room(room_id)
-            
+        # Settle access by role where possible, then check assignment for the
+        # remaining rooms with one pipeline of SISMEMBERs
+        access = {
+            room_id: self._access_without_assignment(room, user_role, is_kid)
+            for room_id, room in rooms.items() if room
+        }
+        unsettled_ids = [room_id for room_id, can_access in access.items() if can_access is None]
+        if unsettled_ids:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for room_id in unsettled_ids:
+                    pipe.sismember(RedisKeys.ROOM_ASSIGNED_USERS.format(room_id=room_id), user_id)
+                for room_id, assigned in zip(unsettled_ids, await pipe.execute()):
+                    access[room_id] = bool(assigned)
+        
+        for room_id, room in rooms.items():
             if room:
-                can_access = await self.can_user_access_room(room, user_id, user_role, is_kid)
+                can_access = access[room_id]
                 logger.info(f"Room {room_id} - private: {room.is_private}, assigned_users: {room.assigned_users}, can_access: {can_access}")
                 
                 if can_access:
@@ -462,16 +700,30 @@ class ChatManager:
         accessible_rooms.sort(key=lambda x: x.created_at, reverse=True)
         return accessible_rooms
     
+    async def _get_room_ids(self) -> List[str]:
+        """Ids of all rooms, from the room index"""
+        if not self._room_index_backfilled:
+            # One SCAN per process picks up rooms stored before the index existed
+            legacy_ids = [key.decode().split(":")[-1] async for key in self.redis.scan_iter(match="chat:room:*")]
+            if legacy_ids:
+                await self.redis.sadd(RedisKeys.ROOM_INDEX, *legacy_ids)
+            self._room_index_backfilled = True
+        
+        return [room_id.decode() for room_id in await self.redis.smembers(RedisKeys.ROOM_INDEX)]
+    
     async def assign_user_to_room(self, room_id: str, user_id: str) -> bool:
         """Assign a user to a private room"""
         try:
-            room = await self.get_room(room_id)
-            if not room:
+            if not await self.get_room(room_id):
                 return False
             
-            if user_id not in room.assigned_users:
-                room.assigned_users.append(user_id)
-                await self.update_room(room_id, assigned_users=room.assigned_users)
+            added = await self.redis.sadd(RedisKeys.ROOM_ASSIGNED_USERS.format(room_id=room_id), user_id)
+            self._room_loads.pop(room_id, None)
+            cached = self._room_cache.get(room_id)
+            if cached is not None and user_id not in cached.assigned_users:
+                cached.assigned_users.append(user_id)
+            
+            if added:
                 logger.info(f"Assigned user {user_id} to room {room_id}")
             
             return True
@@ -482,16 +734,19 @@ class ChatManager:
     async def unassign_user_from_room(self, room_id: str, user_id: str) -> bool:
         """Remove a user assignment from a private room"""
         try:
-            room = await self.get_room(room_id)
-            if not room:
+            if not await self.get_room(room_id):
                 return False
             
-            if user_id in room.assigned_users:
-                room.assigned_users.remove(user_id)
-                await self.update_room(room_id, assigned_users=room.assigned_users)
+            removed = await self.redis.srem(RedisKeys.ROOM_ASSIGNED_USERS.format(room_id=room_id), user_id)
+            self._room_loads.pop(room_id, None)
+            cached = self._room_cache.get(room_id)
+            if cached is not None and user_id in cached.assigned_users:
+                cached.assigned_users.remove(user_id)
+            
+            if removed:
                 logger.info(f"Unassigned user {user_id} from room {room_id}")
             
             return True
         except Exception as e:
             logger.error(f"Error unassigning user {user_id} from room {room_id}: {e}")
-            return False 
\ No newline at end of file
+            return False
@@ -1,15 +1,12 @@
 import os
-import sys
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, Session, raiseload, selectinload
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.exc import SQLAlchemyError
 from loguru import logger
 from contextlib import contextmanager
 from typing import Generator
 
-# Add shared directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-
 from shared.auth_models import Base, UserTable, SessionTable
 from shared.config import Config
 
@@ -24,28 +21,78 @@ class DatabaseManager:
         self.database_url = database_url
         
         # Create engine with SQLite-specific configurations
+        if database_url in ("sqlite://", "sqlite:///:memory:"):
+            # An in-memory database exists only on its one connection
+            pool_args = {"poolclass": StaticPool}
+        else:
+            pool_args = {
+                "pool_size": Config.DB_POOL_SIZE,
+                "max_overflow": Config.DB_MAX_OVERFLOW,
+                "pool_timeout": Config.DB_POOL_TIMEOUT,
+                "pool_recycle": Config.DB_POOL_RECYCLE,
+                "pool_pre_ping": True  # Verify connections before use
+            }
         self.engine = create_engine(
             database_url,
             connect_args={"check_same_thread": False} if "sqlite" in database_url else {},
             echo=Config.DEBUG,  # Log SQL queries in debug mode
-            pool_size=20,  # Increased from default 5
-            max_overflow=30,  # Increased from default 10
-            pool_recycle=3600,  # Recycle connections after 1 hour
-            pool_pre_ping=True  # Verify connections before use
+            **pool_args
         )
         
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", self._configure_sqlite)
+        
         # Create session factory
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        # expire_on_commit=False: objects returned after a commit keep their state
+        # instead of re-SELECTing on first attribute access
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine)
+        if Config.DEBUG:
+            event.listen(self.SessionLocal, "do_orm_execute", self._detect_n_plus_one)
         
         # Create tables if they don't exist
         self.create_tables()
         
         logger.info(f"Database initialized: {database_url}")
     
+    @staticmethod
+    def _configure_sqlite(dbapi_connection, connection_record):
+        """Per-connection SQLite tuning for concurrent request handlers"""
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers proceed alongside the single writer; NORMAL syncs the
+        # WAL at checkpoints instead of on every commit and is still crash-safe
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+        cursor.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache
+        cursor.close()
+    
+    @staticmethod
+    def _detect_n_plus_one(orm_execute_state):
+        """Flag a relationship lazy-loaded for more than one row in the same session"""
+        if not orm_execute_state.is_relationship_load or orm_execute_state.lazy_loaded_from is None:
+            return
+        
+        relationship = str(orm_execute_state.loader_strategy_path[-1])
+        loaded_from = orm_execute_state.session.info.setdefault("lazy_loaded_from", {})
+        parents = loaded_from.setdefault(relationship, set())
+        parents.add(orm_execute_state.lazy_loaded_from.identity_key)
+        
+        # Warn once per relationship per session, on the second parent row
+        if len(parents) == 2:
+            message = f"Potential n+1 query: {relationship} lazy-loaded per row; use selectinload() or a join"
+            if Config.N_PLUS_ONE_RAISE:
+                raise RuntimeError(message)
+            logger.warning(message)
+    
     def create_tables(self):
         """Create all database tables"""
         try:
             Base.metadata.create_all(bind=self.engine)
+            
+            # create_all skips existing tables, so add indexes introduced later
+            for index in UserTable.__table__.indexes:
+                index.create(bind=self.engine, checkfirst=True)
             logger.info("Database tables created successfully")
         except SQLAlchemyError as e:
             logger.error(f"Error creating database tables: {e}")
@@ -78,6 +125,13 @@ class DatabaseManager:
         self.engine.dispose()
         logger.info("Database connections closed")
 
+def apply_safe_loading(stmt, *eager):
+    """Eager-load the given relationships; in debug mode any other lazy load raises"""
+    options = [selectinload(relationship) for relationship in eager]
+    if Config.DEBUG:
+        options.append(raiseload("*"))
+    return stmt.options(*options) if options else stmt
+
 # Global database manager instance
 db_manager = None
 
@@ -1,9 +1,26 @@
 import os
 import io
-from typing import Optional
+import re
+import time
+import asyncio
+import hashlib
+from typing import AsyncIterator, Optional
 from loguru import logger
-from elevenlabs.client import ElevenLabs
-from shared.config import Config
+from shared.config import Config, RedisKeys
+
+# Text cleanup patterns for speech synthesis, compiled once
+_RE_HTML = re.compile(r'<[^>]+>')
+# Matches @username but not user@domain.com
+_RE_MENTION = re.compile(r'(?<!\w)@([a-zA-Z0-9_.-]+)(?!\.[a-zA-Z]{2,})')
+_RE_BOLD = re.compile(r'\*\*(.*?)\*\*')
+_RE_ITALIC = re.compile(r'\*(.*?)\*')
+_RE_CODE = re.compile(r'`(.*?)`')
+_RE_HEADER = re.compile(r'#{1,6}\s*(.*?)(?:\n|$)')
+_RE_PARA = re.compile(r'\n\s*\n')
+
+_AUDIO_CACHE_TTL = 86400 * 7  # seconds
+DEFAULT_OUTPUT_FORMAT = "mp3_44100_128"
+_VOICES_CACHE_TTL = 600  # seconds
 
 
 class ElevenLabsService:
@@ -14,11 +31,19 @@ class ElevenLabsService:
         self.api_key = Config.ELEVENLABS_API_KEY
         self.voice_id = Config.ELEVENLABS_VOICE_ID
         self.model = Config.ELEVENLABS_MODEL
+        self.latency_mode = Config.ELEVENLABS_LATENCY_MODE
         self.enabled = bool(self.api_key)
         self.client = None
+        # Set at startup; used to cache generated audio for repeated text
+        self.redis = None
+        # (expires_at, voices) from the last successful voice listing
+        self._voices_cache = None
         
         if self.enabled:
             try:
+                # The SDK takes most of a second to import, so only load it
+                # when TTS is configured
+                from elevenlabs.client import ElevenLabs
                 self.client = ElevenLabs(api_key=self.api_key)
                 logger.info(f"ElevenLabs service initialized with voice: {self.voice_id} and model: {self.model}")
             except Exception as e:
@@ -31,13 +56,17 @@ class ElevenLabsService:
         """Check if ElevenLabs service is enabled and configured"""
         return self.enabled
     
-    async def text_to_speech(self, text: str, voice_id: Optional[str] = None) -> Optional[bytes]:
+    async def text_to_speech(self, text: str, voice_id: Optional[str] = None,
+                             latency_mode: Optional[int] = None,
+                             output_format: str = DEFAULT_OUTPUT_FORMAT) -> Optional[bytes]:
         """
         Convert text to speech using ElevenLabs API
         
         Args:
             text: Text to convert to speech
             voice_id: Optional voice ID (uses default if not provided)
+            latency_mode: Optional optimize_streaming_latency level 0-4 (uses default if not provided)
+            output_format: ElevenLabs output format, e.g. mp3_44100_128 or pcm_24000
             
         Returns:
             Audio data as bytes or None if failed
@@ -50,28 +79,8 @@ class ElevenLabsService:
             logger.warning("Empty text provided to TTS")
             return None
         
-        # Use provided voice ID or default
-        selected_voice_id = voice_id or self.voice_id
-        
         try:
-            logger.info(f"Generating speech for text: '{text[:50]}...' with voice: {selected_voice_id} and model: {self.model}")
-            
-            # Clean the text for better speech synthesis
-            cleaned_text = self._clean_text_for_speech(text)
-            
-            # Generate speech using ElevenLabs new client API
-            audio = self.client.text_to_speech.convert(
-                text=cleaned_text,
-                voice_id=selected_voice_id,
-                model_id=self.model,
-                output_format="mp3_44100_128"
-            )
-            
-            # Convert generator to bytes if needed
-            if hasattr(audio, '__iter__') and not isinstance(audio, (bytes, bytearray)):
-                audio_bytes = b''.join(audio)
-            else:
-                audio_bytes = audio
+            audio_bytes = b''.join([chunk async for chunk in self.stream_speech(text, voice_id, latency_mode, output_format)])
             
             logger.info(f"Successfully generated {len(audio_bytes)} bytes of audio")
             return audio_bytes
@@ -80,6 +89,105 @@ class ElevenLabsService:
             logger.error(f"Failed to generate speech: {e}")
             return None
     
+    async def stream_speech(self, text: str, voice_id: Optional[str] = None,
+                            latency_mode: Optional[int] = None,
+                            output_format: str = DEFAULT_OUTPUT_FORMAT) -> AsyncIterator[bytes]:
+        """
+        Stream speech audio from ElevenLabs as it is generated
+        
+        The SDK client is synchronous, so the request and every chunk read run
+        in a worker thread instead of blocking the event loop.
+        
+        Args:
+            text: Text to convert to speech
+            voice_id: Optional voice ID (uses default if not provided)
+            latency_mode: Optional optimize_streaming_latency level 0-4 (uses default if not provided)
+            output_format: ElevenLabs output format, e.g. mp3_44100_128 or pcm_24000
+            
+        Yields:
+            Audio chunks in the requested format; raises if the API call fails
+        """
+        # Use provided voice ID or default
+        selected_voice_id = voice_id or self.voice_id
+        # Higher levels trade some quality for a faster first chunk; 4 also
+        # skips the text normalizer, so numbers and dates may be misread
+        selected_latency_mode = self.latency_mode if latency_mode is None else latency_mode
+        
+        logger.info(f"Generating speech for text: '{text[:50]}...' with voice: {selected_voice_id} and model: {self.model}")
+        
+        # Clean the text for better speech synthesis
+        cleaned_text = self._clean_text_for_speech(text)
+        
+        # Identical text, voice, model, latency mode and format always produce the same clip
+        cache_key = RedisKeys.TTS_AUDIO_CACHE.format(digest=hashlib.blake2b(
+            f"{selected_voice_id}\0{self.model}\0{selected_latency_mode}\0{output_format}\0{cleaned_text}".encode(),
+            digest_size=16
+        ).hexdigest())
+        cached_audio = await self._cache_get(cache_key)
+        if cached_audio:
+            logger.debug("Serving cached speech audio")
+            yield cached_audio
+            return
+        
+        # The /stream endpoint starts sending audio before synthesis of the
+        # whole clip finishes
+        audio = await asyncio.to_thread(
+            self.client.text_to_speech.stream,
+            text=cleaned_text,
+            voice_id=selected_voice_id,
+            model_id=self.model,
+            optimize_streaming_latency=selected_latency_mode,
+            output_format=output_format
+        )
+        
+        if isinstance(audio, (bytes, bytearray)):
+            await self._cache_set(cache_key, bytes(audio))
+            yield bytes(audio)
+            return
+        
+        # stream() returns a lazy generator; the HTTP request happens on the first read
+        chunks = iter(audio)
+        audio_parts = []
+        read = None
+        try:
+            while True:
+                # Shielded so a read interrupted by a cancel still finishes before close()
+                read = asyncio.ensure_future(asyncio.to_thread(next, chunks, None))
+                chunk = await asyncio.shield(read)
+                if chunk is None:
+                    break
+                if chunk:
+                    audio_parts.append(chunk)
+                    yield chunk
+        finally:
+            # Release the SDK's HTTP response even if the client disconnected midway
+            if read is not None:
+                await asyncio.gather(read, return_exceptions=True)
+            if hasattr(chunks, "close"):
+                await asyncio.to_thread(chunks.close)
+        
+        # Only a clip that streamed to completion is cached
+        await self._cache_set(cache_key, b''.join(audio_parts))
+    
+    async def _cache_get(self, key: str) -> Optional[bytes]:
+        """Read cached audio, treating a missing or failing Redis as a miss"""
+        if self.redis is None:
+            return None
+        try:
+            return await self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"TTS cache read failed: {e}")
+            return None
+    
+    async def _cache_set(self, key: str, audio: bytes):
+        """Cache generated audio, ignoring Redis errors"""
+        if self.redis is None or not audio:
+            return
+        try:
+            await self.redis.set(key, audio, ex=_AUDIO_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"TTS cache write failed: {e}")
+    
     def _clean_text_for_speech(self, text: str) -> str:
         """
         Clean text for better speech synthesis
@@ -91,28 +199,25 @@ class ElevenLabsService:
             Cleaned text suitable for TTS
         """
         # Remove HTML tags
-        import re
-        text = re.sub(r'<[^>]+>', '', text)
+        text = _RE_HTML.sub('', text)
         
         # Remove @username mentions (but preserve emails)
-        # This matches @username but not user@domain.com
-        text = re.sub(r'(?<!\w)@([a-zA-Z0-9_.-]+)(?!\.[a-zA-Z]{2,})', '', text)
+        text = _RE_MENTION.sub('', text)
         
         # Remove markdown formatting
-        text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)  # Bold
-        text = re.sub(r'\*(.*?)\*', r'\1', text)      # Italic
-        text = re.sub(r'`(.*?)`', r'\1', text)        # Code
-        text = re.sub(r'#{1,6}\s*(.*?)(?:\n|$)', r'\1. ', text)  # Headers
+        text = _RE_BOLD.sub(r'\1', text)    # Bold
+        text = _RE_ITALIC.sub(r'\1', text)  # Italic
+        text = _RE_CODE.sub(r'\1', text)    # Code
+        text = _RE_HEADER.sub(r'\1. ', text)  # Headers
         
         # Replace multiple newlines with periods for natural pauses
-        text = re.sub(r'\n\s*\n', '. ', text)
-        text = re.sub(r'\n', ' ', text)
+        text = _RE_PARA.sub('. ', text)
         
-        # Clean up multiple spaces
-        text = re.sub(r'\s+', ' ', text)
+        # Collapse remaining newlines and runs of whitespace to single spaces and
+        # trim the ends; split() uses the same whitespace definition as \s
+        text = ' '.join(text.split())
         
         # Ensure text ends with proper punctuation
-        text = text.strip()
         if text and text[-1] not in '.!?':
             text += '.'
         
@@ -128,9 +233,15 @@ class ElevenLabsService:
         if not self.enabled or not self.client:
             return []
         
+        # The voice list rarely changes; reuse it for a few minutes
+        if self._voices_cache is not None and self._voices_cache[0] > time.monotonic():
+            return self._voices_cache[1]
+        
         try:
             voice_response = self.client.voices.search()
-            return [{"id": voice.voice_id, "name": voice.name} for voice in voice_response.voices]
+            voices = [{"id": voice.voice_id, "name": voice.name} for voice in voice_response.voices]
+            self._voices_cache = (time.monotonic() + _VOICES_CACHE_TTL, voices)
+            return voices
         except Exception as e:
             logger.error(f"Failed to get voices: {e}")
             return []
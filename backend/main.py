@@ -1,33 +1,37 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import redis.asyncio as redis
-import json
+from cachetools import TTLCache
+import orjson
+import hashlib
 import uuid
+import time
+import bisect
 import asyncio
 from datetime import datetime
 from typing import Dict, List, Set, Optional
 from loguru import logger
 import sys
-import os
 from sqlalchemy.orm import Session
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 import re
 
-# Add shared directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-
 from shared.models import (
     ChatMessage, User, ChatRoom, WebSocketMessage, 
-    MessageType, UserStatus, ConnectionInfo
+    MessageType, UserStatus, ConnectionInfo, message_list_adapter
 )
 from shared.config import Config, RedisKeys, WSEventTypes, AI_TRIGGERS
 from backend.ai_service import AIService
 from backend.chat_manager import ChatManager
 from backend.auth_routes import auth_router, admin_router
-from backend.auth_middleware import get_current_user, authenticate_websocket_user
+from backend.auth_service import auth_service
+from backend import auth_middleware
+from backend.auth_middleware import get_current_user, get_current_admin_user, authenticate_websocket_user, evict_user
 from backend.database import init_database, close_database, get_db_session
 from backend.admin_init import initialize_admin_user
 from backend.elevenlabs_service import elevenlabs_service
@@ -36,8 +40,31 @@ from backend.elevenlabs_service import elevenlabs_service
 logger.remove()
 logger.add(sys.stderr, level=Config.LOG_LEVEL)
 
-# Rate limiter setup
-limiter = Limiter(key_func=get_remote_address)
+# Rate limiter setup; counters live in Redis so every worker enforces the same limits
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=Config.get_rate_limit_storage_uri(),
+    in_memory_fallback_enabled=True
+)
+
+def _rate_limit_user_key(request: Request) -> str:
+    """Rate limit authenticated endpoints per user rather than per IP"""
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return f"user:{user.id}"
+    return get_remote_address(request)
+
+# Styx's entry in every active user list; shared, so never mutated
+_STYX_USER_INFO = {
+    "user_id": "ai_styx",
+    "username": "Styx"
+}
+
+# Frames buffered per connection before a client counts as too slow and is disconnected
+_SEND_QUEUE_SIZE = 256
+# Most frames a writer takes from its queue per batch of back-to-back sends
+_WRITE_BATCH_SIZE = 128
+
 
 class ConnectionManager:
     def __init__(self):
@@ -47,6 +74,18 @@ class ConnectionManager:
         self.user_info: Dict[str, ConnectionInfo] = {}
         # Room memberships
         self.room_members: Dict[str, Set[str]] = {}
+        # Each room's connected users as {"user_id", "username"} entries, kept
+        # sorted alphabetically by username as users connect and disconnect
+        self._room_user_lists: Dict[str, List[Dict[str, str]]] = {}
+        # Set at startup: broadcasts are also published on Redis so users
+        # connected to other worker processes receive them
+        self.redis: Optional[redis.Redis] = None
+        self._worker_id = uuid.uuid4().hex
+        self._relay_task: Optional[asyncio.Task] = None
+        # Outgoing frames by user_id, each queue drained by that connection's
+        # writer task so a slow socket only ever delays its own frames
+        self._send_queues: Dict[str, asyncio.Queue] = {}
+        self._writers: Dict[str, asyncio.Task] = {}
     
     def get_active_users_info(self, room_id: str) -> List[Dict[str, str]]:
         """Get list of active users with their info for a room"""
@@ -54,27 +93,10 @@ class ConnectionManager:
         
         # Add Styx (AI assistant) first if there are human users present
         if room_id in self.room_members and self.room_members[room_id]:
-            styx_data = {
-                "user_id": "ai_styx",
-                "username": "Styx"
-            }
-            active_users_info.append(styx_data)
+            active_users_info.append(_STYX_USER_INFO)
         
         # Add human users, sorted alphabetically
-        if room_id in self.room_members:
-            human_users = []
-            for uid in self.room_members[room_id]:
-                user_info = self.user_info.get(uid)
-                if user_info:
-                    user_data = {
-                        "user_id": uid,
-                        "username": user_info.username
-                    }
-                    human_users.append(user_data)
-            
-            # Sort human users alphabetically by username
-            human_users.sort(key=lambda x: x["username"].lower())
-            active_users_info.extend(human_users)
+        active_users_info.extend(self._room_user_lists.get(room_id, ()))
         
         return active_users_info
     
@@ -85,8 +107,18 @@ class ConnectionManager:
         # Generate unique websocket ID
         ws_id = str(uuid.uuid4())
         
+        # A reconnect can arrive before the old socket's disconnect; the new
+        # connection replaces the old one, so drop the user from the old room's list
+        previous = self.user_info.get(user_id)
+        if previous is not None and previous.room_id in self._room_user_lists:
+            self._remove_from_user_list(self._room_user_lists[previous.room_id], user_id)
+        
         # Store connection info
         self.connections[user_id] = websocket
+        self._stop_writer(user_id)
+        queue = asyncio.Queue(maxsize=_SEND_QUEUE_SIZE)
+        self._send_queues[user_id] = queue
+        self._writers[user_id] = asyncio.create_task(self._write_frames(user_id, websocket, queue))
         self.user_info[user_id] = ConnectionInfo(
             user_id=user_id,
             username=username,
@@ -98,6 +130,7 @@ class ConnectionManager:
         if room_id not in self.room_members:
             self.room_members[room_id] = set()
         self.room_members[room_id].add(user_id)
+        bisect.insort(self._room_user_lists.setdefault(room_id, []), {"user_id": user_id, "username": username}, key=lambda x: x["username"].lower())
         
         logger.info(f"User {username} ({user_id}) connected to room {room_id}")
         
@@ -126,10 +159,11 @@ class ConnectionManager:
         # Send recent message history to the new user
         try:
             recent_messages = await chat_manager.get_recent_messages(room_id, limit=50)
-            for message in recent_messages:
+            if recent_messages:
+                # One frame for the whole history rather than one per message
                 history_msg = {
-                    "type": "message_history",  # Different event type for historical messages
-                    "data": message.to_websocket_dict()
+                    "type": "message_history_batch",  # Different event type for historical messages
+                    "data": {"messages": orjson.Fragment(message_list_adapter.dump_json(recent_messages))}
                 }
                 await self.send_to_user(user_id, history_msg)
         except Exception as e:
@@ -142,7 +176,8 @@ class ConnectionManager:
                 "active_users": active_users
             }
         }
-        await self.broadcast_to_room(room_id, user_list_msg)
+        # User lists only cover this worker's connections, so they stay local
+        await self.broadcast_to_room(room_id, user_list_msg, local_only=True)
     
     async def disconnect(self, user_id: str):
         """Handle WebSocket disconnection"""
@@ -153,6 +188,8 @@ class ConnectionManager:
             
             # Remove from connections
             self.connections.pop(user_id, None)
+            self._send_queues.pop(user_id, None)
+            self._stop_writer(user_id)
             self.user_info.pop(user_id, None)
             
             # Remove from room
@@ -160,6 +197,11 @@ class ConnectionManager:
                 self.room_members[room_id].discard(user_id)
                 if not self.room_members[room_id]:
                     del self.room_members[room_id]
+            user_list = self._room_user_lists.get(room_id)
+            if user_list is not None:
+                self._remove_from_user_list(user_list, user_id)
+                if not user_list:
+                    del self._room_user_lists[room_id]
             
             logger.info(f"User {username} ({user_id}) disconnected from room {room_id}")
             
@@ -179,28 +221,140 @@ class ConnectionManager:
                 "data": {
                     "active_users": self.get_active_users_info(room_id)
                 }
-            })
+            }, local_only=True)
+    
+    @staticmethod
+    def _remove_from_user_list(user_list: List[Dict[str, str]], user_id: str):
+        """Drop a user's entry from a room's sorted user list, if present"""
+        for index, user_data in enumerate(user_list):
+            if user_data["user_id"] == user_id:
+                del user_list[index]
+                return
     
     async def send_to_user(self, user_id: str, message: dict):
         """Send message to specific user"""
         if user_id in self.connections:
+            if not self._enqueue(user_id, orjson.dumps(message).decode()):
+                await self._drop_slow_client(user_id)
+    
+    def _enqueue(self, user_id: str, text: str) -> bool:
+        """Queue an already-encoded frame for a connected user; False if they can't keep up"""
+        try:
+            self._send_queues[user_id].put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Send queue full for user {user_id}, disconnecting slow client")
+            return False
+    
+    async def _drop_slow_client(self, user_id: str):
+        """Disconnect a client that can't keep up and close its socket, which ends its endpoint loop"""
+        websocket = self.connections.get(user_id)
+        await self.disconnect(user_id)
+        if websocket is not None:
             try:
-                await self.connections[user_id].send_text(json.dumps(message))
+                # 1013 "try again later": the client can reconnect and reload history
+                await websocket.close(code=1013)
             except Exception as e:
-                logger.error(f"Error sending message to user {user_id}: {e}")
+                logger.debug(f"Error closing socket for slow user {user_id}: {e}")
+    
+    async def _write_frames(self, user_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        """Send a connection's queued frames until a send fails or the writer is stopped"""
+        try:
+            while True:
+                batch = [await queue.get()]
+                # Take whatever else is already queued and write it back to back,
+                # letting the transport coalesce the frames into fewer socket writes
+                while len(batch) < _WRITE_BATCH_SIZE and not queue.empty():
+                    batch.append(queue.get_nowait())
+                for text in batch:
+                    await websocket.send_text(text)
+        except Exception as e:
+            logger.error(f"Error sending message to user {user_id}: {e}")
+            # Unless the user has since reconnected on a new socket
+            if self.connections.get(user_id) is websocket:
                 await self.disconnect(user_id)
     
-    async def broadcast_to_room(self, room_id: str, message: dict, exclude_user: str = None):
-        """Broadcast message to all users in a room"""
+    def _stop_writer(self, user_id: str):
+        """Cancel a user's writer task, if any; a writer never cancels itself"""
+        writer = self._writers.pop(user_id, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+    
+    async def broadcast_to_room(self, room_id: str, message: dict, exclude_user: str = None, local_only: bool = False):
+        """Broadcast message to all users in a room, on every worker unless local_only"""
+        # Encode once for every recipient rather than once per send; frames
+        # stay text since the client parses event.data as a string
+        payload = orjson.dumps(message).decode()
+        await self._broadcast_local(room_id, payload, exclude_user)
+        
+        if not local_only and self.redis is not None:
+            # Other workers deliver it to their own users (see _relay_room_events)
+            envelope = {"origin": self._worker_id, "exclude_user": exclude_user, "payload": payload}
+            try:
+                await self.redis.publish(RedisKeys.ROOM_EVENTS.format(room_id=room_id), orjson.dumps(envelope))
+            except Exception as e:
+                logger.error(f"Error publishing event to room {room_id}: {e}")
+    
+    async def _broadcast_local(self, room_id: str, payload: str, exclude_user: str = None):
+        """Send an encoded frame to this worker's users in a room"""
         if room_id in self.room_members:
-            for user_id in self.room_members[room_id].copy():
-                if exclude_user and user_id == exclude_user:
-                    continue
-                await self.send_to_user(user_id, message)
+            # Connected members minus the excluded user, computed with C-level set
+            # operations; the new set is also the snapshot the sends iterate
+            recipients = self.room_members[room_id].intersection(self.connections)
+            if exclude_user:
+                recipients.discard(exclude_user)
+            
+            # Queue for every recipient's writer; none of them waits on a socket here
+            slow_users = [user_id for user_id in recipients if not self._enqueue(user_id, payload)]
+            if slow_users:
+                await asyncio.gather(*(self._drop_slow_client(user_id) for user_id in slow_users), return_exceptions=True)
+    
+    def start_relay(self, redis_client: redis.Redis):
+        """Start publishing room broadcasts to, and relaying them from, other workers"""
+        self.redis = redis_client
+        self._relay_task = asyncio.create_task(self._relay_room_events())
+    
+    async def stop_relay(self):
+        """Stop relaying room broadcasts between workers"""
+        if self._relay_task is not None:
+            self._relay_task.cancel()
+            try:
+                await self._relay_task
+            except asyncio.CancelledError:
+                pass
+            self._relay_task = None
+        self.redis = None
+    
+    async def _relay_room_events(self):
+        """Deliver room broadcasts published by other workers to this worker's users,
+        and evict users whose cached rows/tokens another worker invalidated"""
+        pattern = RedisKeys.ROOM_EVENTS.format(room_id="*")
+        channel_prefix = pattern[:-1]
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.psubscribe(pattern)
+                    await pubsub.subscribe(RedisKeys.USER_INVALIDATIONS)
+                    async for event in pubsub.listen():
+                        if event["type"] == "message":
+                            evict_user(int(event["data"]))
+                            continue
+                        if event["type"] != "pmessage":
+                            continue
+                        envelope = orjson.loads(event["data"])
+                        if envelope["origin"] == self._worker_id:
+                            continue
+                        room_id = event["channel"].decode()[len(channel_prefix):]
+                        await self._broadcast_local(room_id, envelope["payload"], envelope["exclude_user"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Room event relay failed, resubscribing: {e}")
+                await asyncio.sleep(1)
 
 
 # Initialize FastAPI app
-app = FastAPI(title="Multi-User AI Chat Backend", version="1.0.0")
+app = FastAPI(title="Multi-User AI Chat Backend", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Add rate limiting state
 app.state.limiter = limiter
@@ -209,14 +363,15 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 # Add CORS middleware - FIXED: Restrict origins for production
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
+    # A frozenset: the middleware checks every request's Origin with `in`
+    allow_origins=frozenset({
         "http://localhost:3000", 
         "http://127.0.0.1:3000",  # Localhost IP aliases (direct access for development)
         "http://daddo.hopto.org:3000",   # HTTP access via nginx
-        "https://daddo.hopto.org:3443"  # HTTPS access via nginx (production)
+        "https://daddo.hopto.org:3443",  # HTTPS access via nginx (production)
         "http://daddo.hopto.org",        # HTTP access via nginx
         "https://daddo.hopto.org"   # HTTPS access via nginx (production)
-    ],  # Restrict to specific origins
+    }),  # Restrict to specific origins
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # Specific methods only
     allow_headers=["*"],
@@ -232,6 +387,10 @@ chat_manager = None
 ai_service = None
 redis_client = None
 
+# Short-lived response cache for the polled /rooms endpoint, keyed by (user_id,
+# role, is_kid) and cleared whenever a room changes
+_rooms_response_cache = TTLCache(maxsize=1024, ttl=5)
+
 
 @app.on_event("startup")
 async def startup_event():
@@ -248,14 +407,20 @@ async def startup_event():
     logger.info("Checking admin user...")
     initialize_admin_user()
     
-    # Initialize Redis
-    redis_client = redis.from_url(Config.get_redis_url())
+    # Initialize Redis; callers wait for a free connection once the pool is
+    # full instead of opening an unbounded number of them under load
+    redis_client = redis.Redis.from_pool(redis.BlockingConnectionPool.from_url(
+        Config.get_redis_url(), max_connections=Config.REDIS_MAX_CONNECTIONS
+    ))
     await redis_client.ping()
     logger.info("Redis connection established")
     
     # Initialize services
     chat_manager = ChatManager(redis_client)
-    ai_service = AIService()
+    ai_service = AIService(redis_client)
+    elevenlabs_service.redis = redis_client
+    auth_middleware.invalidation_redis = redis_client
+    connection_manager.start_relay(redis_client)
     
     # Create default chat room
     await chat_manager.create_room(
@@ -273,10 +438,20 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     global redis_client
+    # Let cancelled replies unwind before the clients they use are closed
+    tasks = list(_ai_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await connection_manager.stop_relay()
+    auth_middleware.invalidation_redis = None
+    if ai_service:
+        await ai_service.close()
     if redis_client:
         await redis_client.close()
     
-    # Close database connections
+    # Write pending login/activity timestamps, then close database connections
+    auth_service.activity.stop()
     close_database()
     
     logger.info("Backend services shut down")
@@ -291,23 +466,22 @@ async def websocket_endpoint(
 ):
     """Main WebSocket endpoint for chat communication (requires authentication)"""
     # Authenticate user
-    user = authenticate_websocket_user(token, db)
+    user = await run_in_threadpool(authenticate_websocket_user, token, db)
     if not user:
         await websocket.close(code=4001, reason="Authentication failed")
         return
     
     # Check room access permissions
     try:
-        room = await chat_manager.get_room(room_id)
-        if not room:
-            await websocket.close(code=4004, reason="Room not found")
-            return
-        
         user_id = str(user.id)
         user_role = user.role
         is_kid = getattr(user, 'is_kid_account', False)
         
-        can_access = await chat_manager.can_user_access_room(room, user_id, user_role, is_kid)
+        room, can_access = await chat_manager.get_room_with_access(room_id, user_id, user_role, is_kid)
+        if not room:
+            await websocket.close(code=4004, reason="Room not found")
+            return
+        
         if not can_access:
             await websocket.close(code=4003, reason="Access denied to this room")
             return
@@ -326,7 +500,12 @@ async def websocket_endpoint(
         while True:
             # Receive message from client
             data = await websocket.receive_text()
-            message_data = json.loads(data)
+            
+            # Dropped as a slow client, or replaced by a newer connection
+            if connection_manager.connections.get(user_id) is not websocket:
+                break
+            
+            message_data = orjson.loads(data)
             
             # Process message based on type
             await handle_websocket_message(
@@ -334,36 +513,54 @@ async def websocket_endpoint(
             )
             
     except WebSocketDisconnect:
-        await connection_manager.disconnect(user_id)
+        pass
     except Exception as e:
-        logger.error(f"WebSocket error for user {user_id}: {e}")
+        # A socket closed by the manager (slow client) fails its pending receive; that's expected
+        if connection_manager.connections.get(user_id) is websocket:
+            logger.error(f"WebSocket error for user {user_id}: {e}")
+    
+    # Unless the user has since reconnected on a new socket
+    if connection_manager.connections.get(user_id) is websocket:
         await connection_manager.disconnect(user_id)
 
 
+def _trigger_pattern(triggers: List[str]) -> re.Pattern:
+    """
+    One regex for all triggers, searched against lowercased content: @ mentions need
+    start of string or whitespace before the @, phrase triggers like "hey ai",
+    "hey bot", etc. start at a word boundary, and both end at whitespace,
+    punctuation or the end.
+    """
+    def alternation(group: List[str]) -> str:
+        return '|'.join(re.escape(trigger.lower()) for trigger in group)
+    
+    mentions = [t for t in triggers if t.startswith('@')]
+    phrases = [t for t in triggers if not t.startswith('@')]
+    branches = []
+    if mentions:
+        branches.append(r'(?:^|(?<=\s))(?:' + alternation(mentions) + r')')
+    if phrases:
+        branches.append(r'\b(?:' + alternation(phrases) + r')')
+    return re.compile(r'(?:' + '|'.join(branches) + r')(?=\s|[,.!?;:]|$)')
+
+
+_AI_TRIGGER_RE = _trigger_pattern(AI_TRIGGERS)
+# Most messages contain no trigger at all; a plain substring check on the
+# lowercased content rules them out before the regex runs, and the same
+# lowercased copy is what the pattern searches
+_AI_TRIGGERS_LOWER = tuple(trigger.lower() for trigger in AI_TRIGGERS)
+
+
 def should_trigger_ai_response(content: str) -> bool:
     """
     Check if message content should trigger an AI response.
     Handles punctuation and word boundaries properly.
     """
     content_lower = content.lower()
+    if not any(trigger in content_lower for trigger in _AI_TRIGGERS_LOWER):
+        return False
     
-    for trigger in AI_TRIGGERS:
-        trigger_lower = trigger.lower()
-        
-        # For @ mentions, look for start of string or whitespace before @
-        if trigger_lower.startswith('@'):
-            # Match @word at start or after whitespace, followed by word boundary or punctuation
-            pattern = r'(^|\s)' + re.escape(trigger_lower) + r'(?=\s|[,.!?;:]|$)'
-            if re.search(pattern, content_lower):
-                return True
-        else:
-            # For phrase triggers like "hey ai", "hey bot", etc.
-            # Allow punctuation after the phrase
-            pattern = r'\b' + re.escape(trigger_lower) + r'(?=\s|[,.!?;:]|$)'
-            if re.search(pattern, content_lower):
-                return True
-    
-    return False
+    return _AI_TRIGGER_RE.search(content_lower) is not None
 
 
 async def handle_websocket_message(user_id: str, room_id: str, ws_message: WebSocketMessage):
@@ -410,24 +607,62 @@ async def handle_chat_message(user_id: str, room_id: str, message_data: dict):
         message_type=MessageType.USER
     )
     
-    # Store message in Redis
-    await chat_manager.store_message(chat_message)
-    
-    # Broadcast to all users in room
-    await connection_manager.broadcast_to_room(room_id, {
-        "type": WSEventTypes.MESSAGE_RECEIVED,
-        "data": chat_message.to_websocket_dict()
-    })
-    
     # Check if AI should respond
     should_trigger_ai = should_trigger_ai_response(content)
     
+    # Store message in Redis and broadcast to all users in room
+    await asyncio.gather(
+        chat_manager.store_message(chat_message),
+        connection_manager.broadcast_to_room(room_id, {
+            "type": WSEventTypes.MESSAGE_RECEIVED,
+            "data": chat_message.to_websocket_dict()
+        })
+    )
+    
     if should_trigger_ai:
-        await handle_ai_response(room_id, content, user_info.username)
+        # Generate in the background so this connection keeps reading messages
+        task = asyncio.create_task(respond_in_turn(room_id, chat_message.message_id, content, user_info.username))
+        _ai_tasks.add(task)
+        task.add_done_callback(_ai_tasks.discard)
 
 
-async def handle_ai_response(room_id: str, user_message: str, username: str):
-    """Generate and send AI response"""
+async def respond_in_turn(room_id: str, message_id: str, user_message: str, username: str):
+    """Run handle_ai_response once any reply already in progress in the room is done"""
+    lock = _ai_room_locks.setdefault(room_id, asyncio.Lock())
+    _ai_room_replies[room_id] = _ai_room_replies.get(room_id, 0) + 1
+    try:
+        async with lock:
+            # Read the history only now, so it includes the reply this one waited for.
+            # The AI service adds the triggering message itself, so leave it out here
+            recent_messages = await chat_manager.get_recent_messages(room_id, limit=_AI_HISTORY_LIMIT + 1)
+            chat_history = [message for message in recent_messages if message.message_id != message_id][-_AI_HISTORY_LIMIT:]
+            await handle_ai_response(room_id, user_message, username, chat_history)
+    finally:
+        # The last reply holding or waiting for the lock removes it
+        _ai_room_replies[room_id] -= 1
+        if not _ai_room_replies[room_id]:
+            del _ai_room_replies[room_id]
+            del _ai_room_locks[room_id]
+
+
+# Recent messages given to the AI as conversation context
+_AI_HISTORY_LIMIT = 10
+
+# Streamed AI deltas are sent in batches of at most this many chunks, or as
+# soon as this long has passed since the last frame
+_AI_CHUNK_FLUSH_COUNT = 32
+_AI_CHUNK_FLUSH_SECONDS = 0.08
+
+# Background AI replies, referenced until they finish, and one lock per room so
+# a room's replies are generated one at a time. A room's lock exists only while
+# replies are pending; _ai_room_replies counts those holding or waiting for it
+_ai_tasks: Set[asyncio.Task] = set()
+_ai_room_locks: Dict[str, asyncio.Lock] = {}
+_ai_room_replies: Dict[str, int] = {}
+
+
+async def handle_ai_response(room_id: str, user_message: str, username: str, chat_history: List[ChatMessage]):
+    """Generate and send AI response, given the room's history before the user's message"""
     try:
         # Notify users that AI is typing
         await connection_manager.broadcast_to_room(room_id, {
@@ -435,28 +670,44 @@ async def handle_ai_response(room_id: str, user_message: str, username: str):
             "data": {"typing": True}
         })
         
-        # Get room information for custom prompt and model
+        # Get room information for custom prompt and model (usually served from
+        # chat_manager's room cache)
         room = await chat_manager.get_room(room_id)
         room_prompt = room.ai_system_prompt if room else None
         room_model = room.ai_model if room else None
         
-        # Get recent chat history for context (exclude the current message to avoid duplicates)
-        chat_history = await chat_manager.get_recent_messages(room_id, limit=10)
+        # Stream the AI response to the room as it is generated, coalescing
+        # deltas into one frame per _AI_CHUNK_FLUSH_COUNT chunks or
+        # _AI_CHUNK_FLUSH_SECONDS, whichever comes first
+        message_id = str(uuid.uuid4())
+        chunks = []
+        pending = []
+        last_flush = time.monotonic()
         
-        # Remove the current user message from history if it's the most recent one
-        # (since we'll add it separately in the AI service)
-        if chat_history and chat_history[-1].content == user_message and chat_history[-1].sender_name == username:
-            chat_history = chat_history[:-1]
+        async def flush_pending():
+            await connection_manager.broadcast_to_room(room_id, {
+                "type": WSEventTypes.AI_RESPONSE_CHUNK,
+                "data": {"message_id": message_id, "content": "".join(pending)}
+            })
+            pending.clear()
         
-        # Generate AI response with room-specific prompt and model
-        ai_response = await ai_service.generate_response(
+        async for chunk in ai_service.stream_response(
             user_message, username, chat_history, room_prompt, room_model
-        )
+        ):
+            chunks.append(chunk)
+            pending.append(chunk)
+            now = time.monotonic()
+            if len(pending) >= _AI_CHUNK_FLUSH_COUNT or now - last_flush >= _AI_CHUNK_FLUSH_SECONDS:
+                await flush_pending()
+                last_flush = now
+        if pending:
+            await flush_pending()
+        ai_response = "".join(chunks).strip()
         
         if ai_response:
             # Create AI message
             ai_message = ChatMessage(
-                message_id=str(uuid.uuid4()),
+                message_id=message_id,
                 chat_room_id=room_id,
                 sender_id="ai_styx",
                 sender_name="Styx",
@@ -467,17 +718,20 @@ async def handle_ai_response(room_id: str, user_message: str, username: str):
             # Store AI message
             await chat_manager.store_message(ai_message)
             
-            # Broadcast AI response
+            # Broadcast the complete AI response (replaces the streamed preview);
+            # ai_typing_done stops the typing indicator in the same frame
+            message_data = ai_message.to_websocket_dict()
+            message_data["ai_typing_done"] = True
             await connection_manager.broadcast_to_room(room_id, {
                 "type": WSEventTypes.MESSAGE_RECEIVED,
-                "data": ai_message.to_websocket_dict()
+                "data": message_data
+            })
+        else:
+            # Stop typing indicator
+            await connection_manager.broadcast_to_room(room_id, {
+                "type": WSEventTypes.AI_TYPING,
+                "data": {"typing": False}
             })
-        
-        # Stop typing indicator
-        await connection_manager.broadcast_to_room(room_id, {
-            "type": WSEventTypes.AI_TYPING,
-            "data": {"typing": False}
-        })
         
     except Exception as e:
         logger.error(f"Error generating AI response: {e}")
@@ -560,41 +814,33 @@ async def health_check(request: Request):
 @app.get("/models")
 async def get_available_models():
     """Get available AI models from the OpenAI endpoint"""
-    try:
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{Config.AI_MODEL_URL}/v1/models", timeout=10.0)
-            if response.status_code == 200:
-                models_data = response.json()
-                # Filter out embedding models and format for UI
-                chat_models = []
-                for model in models_data.get("data", []):
-                    model_id = model.get("id", "")
-                    # Skip embedding models
-                    if "embed" not in model_id.lower():
-                        # Create a user-friendly display name
-                        display_name = model_id
-                        if "llama" in model_id.lower():
-                            if "3.2" in model_id:
-                                display_name = "Llama 3.2 (8x3B MoE)"
-                            elif "3.1" in model_id:
-                                display_name = "Llama 3.1 (8B)"
-                        elif "deepseek" in model_id.lower():
-                            display_name = "DeepSeek R1 (7B)"
-                        
-                        chat_models.append({
-                            "id": model_id,
-                            "name": display_name
-                        })
-                
-                return {"models": chat_models}
-            else:
-                logger.error(f"Failed to fetch models: HTTP {response.status_code}")
-                return {"models": []}
-    except Exception as e:
-        logger.error(f"Error fetching available models: {e}")
+    models_data = await ai_service.get_model_info()
+    if models_data is None:
         # Return a fallback default model
         return {"models": [{"id": "meta-llama-3.1-8b-instruct", "name": "Llama 3.1 (8B)"}]}
+    
+    # Filter out embedding models and format for UI
+    chat_models = []
+    for model in models_data.get("data", []):
+        model_id = model.get("id", "")
+        # Skip embedding models
+        if "embed" not in model_id.lower():
+            # Create a user-friendly display name
+            display_name = model_id
+            if "llama" in model_id.lower():
+                if "3.2" in model_id:
+                    display_name = "Llama 3.2 (8x3B MoE)"
+                elif "3.1" in model_id:
+                    display_name = "Llama 3.1 (8B)"
+            elif "deepseek" in model_id.lower():
+                display_name = "DeepSeek R1 (7B)"
+            
+            chat_models.append({
+                "id": model_id,
+                "name": display_name
+            })
+    
+    return {"models": chat_models}
 
 
 @app.get("/rooms")
@@ -606,14 +852,21 @@ async def get_user_rooms(request: Request, current_user = Depends(get_current_us
         user_role = current_user.role
         is_kid = getattr(current_user, 'is_kid_account', False)
         
+        cache_key = (user_id, user_role, is_kid)
+        cached = _rooms_response_cache.get(cache_key)
+        if cached is not None:
+            return Response(cached, media_type="application/json")
+        
         # Get rooms accessible to this user
         accessible_rooms = await chat_manager.get_accessible_rooms(user_id, user_role, is_kid)
         
+        # Last activity comes from each room's latest message, fetched for all rooms at once
+        last_messages = await chat_manager.get_last_messages_bulk([room.room_id for room in accessible_rooms])
+        
         rooms = []
         for room in accessible_rooms:
-            # Get recent message count and last activity
-            recent_messages = await chat_manager.get_recent_messages(room.room_id, limit=1)
-            last_activity = recent_messages[0].timestamp if recent_messages else room.created_at
+            last_message = last_messages.get(room.room_id)
+            last_activity = last_message.timestamp if last_message else room.created_at
             
             rooms.append({
                 "room_id": room.room_id,
@@ -633,7 +886,10 @@ async def get_user_rooms(request: Request, current_user = Depends(get_current_us
         
         # Sort by last activity (most recent first)
         rooms.sort(key=lambda x: x["last_activity"], reverse=True)
-        return {"rooms": rooms}
+        # Cached already serialized, so repeat polls skip encoding entirely
+        body = orjson.dumps({"rooms": rooms})
+        _rooms_response_cache[cache_key] = body
+        return Response(body, media_type="application/json")
         
     except Exception as e:
         logger.error(f"Error getting user rooms: {e}")
@@ -693,6 +949,7 @@ async def create_room(
             is_private=is_private,
             assigned_users=assigned_users
         )
+        _rooms_response_cache.clear()
         
         return {
             "room_id": room.room_id,
@@ -754,10 +1011,7 @@ async def update_room(
             raise HTTPException(status_code=404, detail="Room not found")
         
         # Check if user is admin or room creator
-        user_is_admin = getattr(current_user, 'role', '') == 'admin'
-        user_is_creator = room.created_by == str(current_user.id)
-        
-        if not user_is_admin and not user_is_creator:
+        if not current_user.is_admin and room.created_by != str(current_user.id):
             raise HTTPException(status_code=403, detail="Only admin or room creator can update room settings")
         
         # Extract update data
@@ -778,6 +1032,7 @@ async def update_room(
             voice_readback_enabled=voice_readback_enabled,
             voice_id=voice_id
         )
+        _rooms_response_cache.clear()
         
         if not updated_room:
             raise HTTPException(status_code=500, detail="Failed to update room")
@@ -805,20 +1060,11 @@ async def update_room(
 @app.delete("/rooms/{room_id}")
 async def delete_room(
     room_id: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_admin_user)
 ):
     """Delete a room (admin only)"""
     try:
-        # Debug logging
-        logger.info(f"Delete room request - User: {current_user.username} (ID: {current_user.id})")
-        logger.info(f"User attributes: is_admin={getattr(current_user, 'is_admin', None)}, role={getattr(current_user, 'role', None)}")
-        
-        # Check admin status (use role field - is_admin doesn't exist in the model)
-        user_is_admin = getattr(current_user, 'role', '') == 'admin'
-        logger.info(f"Final admin check result: {user_is_admin}")
-        
-        if not user_is_admin:
-            raise HTTPException(status_code=403, detail="Only admin can delete rooms")
+        logger.debug(f"Delete room request - User: {current_user.username} (ID: {current_user.id})")
         
         # Prevent deletion of default room
         if room_id == Config.DEFAULT_ROOM_ID:
@@ -832,11 +1078,15 @@ async def delete_room(
         # Disconnect all users from the room first
         if room_id in connection_manager.room_members:
             users_to_disconnect = list(connection_manager.room_members[room_id])
-            for user_id in users_to_disconnect:
-                await connection_manager.disconnect(user_id)
+            # Disconnects are independent; one failing must not stop the rest
+            await asyncio.gather(
+                *(connection_manager.disconnect(user_id) for user_id in users_to_disconnect),
+                return_exceptions=True
+            )
         
         # Delete the room
         success = await chat_manager.delete_room(room_id)
+        _rooms_response_cache.clear()
         if not success:
             raise HTTPException(status_code=500, detail="Failed to delete room")
         
@@ -857,22 +1107,18 @@ async def get_room_messages(
 ):
     """Get recent messages for a room (requires authentication)"""
     messages = await chat_manager.get_recent_messages(room_id, limit)
-    return {"messages": [msg.to_websocket_dict() for msg in messages]}
+    # Serialize directly without jsonable_encoder
+    body = orjson.dumps({"messages": orjson.Fragment(message_list_adapter.dump_json(messages))})
+    return Response(body, media_type="application/json")
 
 
 @app.delete("/rooms/{room_id}/messages")
 async def clear_room_messages(
     room_id: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_admin_user)
 ):
     """Clear all messages from a room (admin only)"""
     try:
-        # Check admin status (use role field - is_admin doesn't exist in the model)
-        user_is_admin = getattr(current_user, 'role', '') == 'admin'
-        
-        if not user_is_admin:
-            raise HTTPException(status_code=403, detail="Only admin can clear room messages")
-        
         # Check if room exists
         room = await chat_manager.get_room(room_id)
         if not room:
@@ -880,6 +1126,7 @@ async def clear_room_messages(
         
         # Clear all messages from the room
         success = await chat_manager.clear_room_messages(room_id)
+        _rooms_response_cache.clear()
         if not success:
             raise HTTPException(status_code=500, detail="Failed to clear room messages")
         
@@ -892,8 +1139,46 @@ async def clear_room_messages(
         raise HTTPException(status_code=500, detail="Failed to clear room messages")
 
 
+# ?format= value -> (ElevenLabs output format, media type, filename)
+_SPEECH_FORMATS = {
+    "mp3": ("mp3_44100_128", "audio/mpeg", "speech.mp3"),
+    # Raw 16-bit little-endian mono samples; skips the MP3 encoder entirely
+    "pcm": ("pcm_24000", "audio/L16; rate=24000", None),
+}
+
+
+async def _speech_response(text: str, voice_id: Optional[str], speech_format: str = "mp3") -> StreamingResponse:
+    """Stream generated speech to the client as ElevenLabs produces it"""
+    output_format, media_type, filename = _SPEECH_FORMATS[speech_format]
+    audio_stream = elevenlabs_service.stream_speech(text, voice_id, output_format=output_format)
+    
+    # Wait for the first chunk so API failures still turn into an error status
+    try:
+        first_chunk = await anext(audio_stream, None)
+    except Exception as e:
+        logger.error(f"Failed to generate speech: {e}")
+        first_chunk = None
+    
+    if not first_chunk:
+        raise HTTPException(status_code=500, detail="Failed to generate speech")
+    
+    async def audio_body():
+        yield first_chunk
+        try:
+            async for chunk in audio_stream:
+                yield chunk
+        except Exception as e:
+            logger.error(f"Speech stream interrupted: {e}")
+    
+    headers = {"Cache-Control": "private, max-age=3600"}
+    if filename:
+        headers["Content-Disposition"] = f"inline; filename={filename}"
+    
+    return StreamingResponse(audio_body(), media_type=media_type, headers=headers)
+
+
 @app.post("/tts")
-@limiter.limit("20/minute")  # Allow 20 TTS requests per minute
+@limiter.limit("20/minute", key_func=_rate_limit_user_key)  # Allow 20 TTS requests per minute per user
 async def text_to_speech(
     request: Request,
     tts_data: dict,
@@ -915,21 +1200,7 @@ async def text_to_speech(
             raise HTTPException(status_code=503, detail="Text-to-speech service is not available")
         
         # Generate speech
-        audio_data = await elevenlabs_service.text_to_speech(text, voice_id)
-        
-        if not audio_data:
-            raise HTTPException(status_code=500, detail="Failed to generate speech")
-        
-        # Return audio data
-        from fastapi.responses import Response
-        return Response(
-            content=audio_data,
-            media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": "inline; filename=speech.mp3",
-                "Cache-Control": "public, max-age=3600"
-            }
-        )
+        return await _speech_response(text, voice_id)
         
     except HTTPException:
         raise
@@ -939,14 +1210,15 @@ async def text_to_speech(
 
 
 @app.post("/tts/{room_id}")
-@limiter.limit("20/minute")  # Allow 20 TTS requests per minute
+@limiter.limit("120/minute", key_func=_rate_limit_user_key)  # Readback requests one clip per sentence of each AI reply
 async def room_text_to_speech(
     request: Request,
     room_id: str,
     tts_data: dict,
+    speech_format: str = Query("pcm", alias="format", pattern="^(pcm|mp3)$"),
     current_user = Depends(get_current_user)
 ):
-    """Convert text to speech using room-specific voice"""
+    """Convert text to speech using room-specific voice, as raw PCM by default or MP3 with ?format=mp3"""
     try:
         text = tts_data.get("text", "").strip()
         
@@ -969,21 +1241,7 @@ async def room_text_to_speech(
         voice_id = room.voice_id
         
         # Generate speech with room's voice
-        audio_data = await elevenlabs_service.text_to_speech(text, voice_id)
-        
-        if not audio_data:
-            raise HTTPException(status_code=500, detail="Failed to generate speech")
-        
-        # Return audio data
-        from fastapi.responses import Response
-        return Response(
-            content=audio_data,
-            media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": "inline; filename=speech.mp3",
-                "Cache-Control": "public, max-age=3600"
-            }
-        )
+        return await _speech_response(text, voice_id, speech_format)
         
     except HTTPException:
         raise
@@ -992,15 +1250,29 @@ async def room_text_to_speech(
         raise HTTPException(status_code=500, detail="Text-to-speech conversion failed")
 
 
+def _etag_response(request: Request, payload: dict, cache_control: str) -> Response:
+    """JSON response tagged with a hash of its body, or an empty 304 if the client already has it"""
+    body = orjson.dumps(payload)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
 @app.get("/tts/voices")
-async def get_available_voices(current_user = Depends(get_current_user)):
+async def get_available_voices(request: Request, current_user = Depends(get_current_user)):
     """Get list of available ElevenLabs voices"""
     try:
         if not elevenlabs_service.is_enabled():
-            return {"voices": [], "enabled": False}
+            return _etag_response(request, {"voices": [], "enabled": False}, "private, max-age=60")
         
-        voices = elevenlabs_service.get_available_voices()
-        return {"voices": voices, "enabled": True}
+        voices = await run_in_threadpool(elevenlabs_service.get_available_voices)
+        # An empty list means the lookup failed; let the next request retry it
+        return _etag_response(request, {"voices": voices, "enabled": True},
+                              "private, max-age=60" if voices else "no-store")
         
     except Exception as e:
         logger.error(f"Error getting voices: {e}")
@@ -1008,27 +1280,25 @@ async def get_available_voices(current_user = Depends(get_current_user)):
 
 
 @app.get("/users")
-async def get_all_users(current_user = Depends(get_current_user), db: Session = Depends(get_db_session)):
+async def get_all_users(request: Request, current_user = Depends(get_current_admin_user), db: Session = Depends(get_db_session)):
     """Get all users for admin purposes (admin only)"""
-    if current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
+        from sqlalchemy import select
         from shared.auth_models import UserTable
-        users = db.query(UserTable).filter(UserTable.is_active == True).all()
-        
-        user_list = []
-        for user in users:
-            user_list.append({
-                "id": user.id,
-                "username": user.username,
-                "full_name": user.full_name,
-                "role": user.role,
-                "is_kid_account": user.is_kid_account,
-                "avatar_color": user.avatar_color
-            })
-        
-        return {"users": user_list}
+        # Only the listed columns, as plain rows rather than hydrated ORM objects
+        stmt = select(
+            UserTable.id,
+            UserTable.username,
+            UserTable.full_name,
+            UserTable.role,
+            UserTable.is_kid_account,
+            UserTable.avatar_color
+        ).where(UserTable.is_active == True)
+        rows = await run_in_threadpool(lambda: db.execute(stmt).all())
+        
+        # Admins expect user edits to show up immediately, so clients always
+        # revalidate; an unchanged list comes back as an empty 304
+        return _etag_response(request, {"users": [dict(row._mapping) for row in rows]}, "private, no-cache")
         
     except Exception as e:
         logger.error(f"Error getting users: {e}")
@@ -1039,12 +1309,9 @@ async def get_all_users(current_user = Depends(get_current_user), db: Session =
 async def assign_users_to_room(
     room_id: str,
     assignment_data: dict,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_admin_user)
 ):
     """Assign users to a private room (admin only)"""
-    if current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
         user_ids = assignment_data.get("user_ids", [])
         
@@ -1058,6 +1325,7 @@ async def assign_users_to_room(
             room_id=room_id,
             assigned_users=user_ids
         )
+        _rooms_response_cache.clear()
         
         if not updated_room:
             raise HTTPException(status_code=500, detail="Failed to update room assignments")
@@ -1078,15 +1346,13 @@ async def assign_users_to_room(
 async def check_room_access(room_id: str, current_user = Depends(get_current_user)):
     """Check if current user can access a specific room"""
     try:
-        room = await chat_manager.get_room(room_id)
-        if not room:
-            raise HTTPException(status_code=404, detail="Room not found")
-        
         user_id = str(current_user.id)
         user_role = current_user.role
         is_kid = getattr(current_user, 'is_kid_account', False)
         
-        can_access = await chat_manager.can_user_access_room(room, user_id, user_role, is_kid)
+        room, can_access = await chat_manager.get_room_with_access(room_id, user_id, user_role, is_kid)
+        if not room:
+            raise HTTPException(status_code=404, detail="Room not found")
         
         return {
             "can_access": can_access,
@@ -1111,7 +1377,7 @@ if __name__ == "__main__":
     logger.add(sys.stderr, level=Config.LOG_LEVEL)
     
     uvicorn.run(
-        "main:app",
+        "backend.main:app",
         host="0.0.0.0",
         port=Config.BACKEND_PORT,
         reload=Config.DEBUG,
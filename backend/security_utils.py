@@ -2,11 +2,36 @@
 Security utilities for credential handling and validation
 """
 import re
+import hmac
 import secrets
 import hashlib
 from typing import Tuple
 from loguru import logger
 
+# Password character class checks, in the order their errors are reported
+_RE_UPPER = re.compile(r'[A-Z]')
+_RE_LOWER = re.compile(r'[a-z]')
+_RE_DIGIT = re.compile(r'\d')
+_RE_SPECIAL = re.compile(r'[!@#$%^&*(),.?":{}|<>]')
+
+_WEAK_PASSWORDS = frozenset({
+    'password', '123456', '12345678', 'qwerty', 'abc123',
+    'admin', 'admin123', 'admin123!', 'password123', 'letmein'
+})
+
+# Common credential patterns, as one alternation so text is scanned once
+_RE_CREDENTIAL = re.compile('|'.join([
+    r'password\s*[=:]\s*[\'"]?([^\s\'"]+)',
+    r'api[_-]?key\s*[=:]\s*[\'"]?([^\s\'"]+)',
+    r'secret\s*[=:]\s*[\'"]?([^\s\'"]+)',
+    r'token\s*[=:]\s*[\'"]?([^\s\'"]+)',
+    r'Bearer\s+([A-Za-z0-9\-_]+)',
+    r'sk-[A-Za-z0-9]{20,}',  # OpenAI API key pattern
+]), re.IGNORECASE)
+# Every credential pattern contains one of these; casefolded text without any
+# of them cannot match, so the regex is skipped
+_CREDENTIAL_HINTS = ('password', 'api', 'secret', 'token', 'bearer', 'sk-')
+
 
 def validate_password_strength(password: str, min_length: int = 8, require_strong: bool = True) -> Tuple[bool, str]:
     """
@@ -20,25 +45,20 @@ def validate_password_strength(password: str, min_length: int = 8, require_stron
         return False, f"Password must be at least {min_length} characters long"
     
     # Check for required character types
-    if not re.search(r'[A-Z]', password):
+    if not _RE_UPPER.search(password):
         return False, "Password must contain at least one uppercase letter"
     
-    if not re.search(r'[a-z]', password):
+    if not _RE_LOWER.search(password):
         return False, "Password must contain at least one lowercase letter"
     
-    if not re.search(r'\d', password):
+    if not _RE_DIGIT.search(password):
         return False, "Password must contain at least one digit"
     
-    if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
+    if not _RE_SPECIAL.search(password):
         return False, "Password must contain at least one special character"
     
     # Check for common weak patterns
-    weak_passwords = [
-        'password', '123456', '12345678', 'qwerty', 'abc123',
-        'admin', 'admin123', 'admin123!', 'password123', 'letmein'
-    ]
-    
-    if password.lower() in weak_passwords:
+    if password.lower() in _WEAK_PASSWORDS:
         return False, "Password is too common and easily guessed"
     
     # Check for repeated characters
@@ -56,6 +76,9 @@ def mask_sensitive_value(value: str, mask_char: str = "*", show_last: int = 4) -
     if not value or len(value) <= show_last:
         return mask_char * 8  # Return fixed length mask for short values
     
+    if len(mask_char) == 1:
+        # Pad the visible tail out to full length in one allocation
+        return value[-show_last:].rjust(len(value), mask_char)
     return mask_char * (len(value) - show_last) + value[-show_last:]
 
 
@@ -67,16 +90,9 @@ def generate_secure_token(length: int = 32) -> str:
 def constant_time_compare(a: str, b: str) -> bool:
     """
     Constant time string comparison to prevent timing attacks
-    Note: For production, use hmac.compare_digest() for cryptographic comparisons
     """
-    if len(a) != len(b):
-        return False
-    
-    result = 0
-    for x, y in zip(a, b):
-        result |= ord(x) ^ ord(y)
-    
-    return result == 0
+    # compare_digest only accepts ASCII str, so compare the UTF-8 bytes
+    return hmac.compare_digest(a.encode(), b.encode())
 
 
 def log_security_event(event_type: str, details: dict, user_id: str = None, ip_address: str = None):
@@ -125,18 +141,7 @@ def check_for_credential_leakage(text: str) -> bool:
     Check if text contains potential credential patterns
     Returns True if potential credentials found
     """
-    # Common credential patterns
-    patterns = [
-        r'password\s*[=:]\s*[\'"]?([^\s\'"]+)',
-        r'api[_-]?key\s*[=:]\s*[\'"]?([^\s\'"]+)',
-        r'secret\s*[=:]\s*[\'"]?([^\s\'"]+)',
-        r'token\s*[=:]\s*[\'"]?([^\s\'"]+)',
-        r'Bearer\s+([A-Za-z0-9\-_]+)',
-        r'sk-[A-Za-z0-9]{20,}',  # OpenAI API key pattern
-    ]
-    
-    for pattern in patterns:
-        if re.search(pattern, text, re.IGNORECASE):
-            return True
-    
-    return False 
\ No newline at end of file
+    folded = text.casefold()
+    if not any(hint in folded for hint in _CREDENTIAL_HINTS):
+        return False
+    return _RE_CREDENTIAL.search(text) is not None 
\ No newline at end of file
@@ -15,7 +15,7 @@ import os
 import sys
 import json
 import argparse
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, delete, func, select
 from sqlalchemy.orm import sessionmaker
 from loguru import logger
 import redis
@@ -26,6 +26,16 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
 from shared.auth_models import UserTable, Base
 from shared.config import Config
 
+# Keys per SCAN page and per pipelined delete batch
+_BATCH_SIZE = 500
+# Usernames shown in a summary line; --verbose lists every user
+_SAMPLE_SIZE = 20
+
+def _sample_usernames(users) -> str:
+    """The first few usernames, for one summary log line"""
+    usernames = ", ".join(user.username for user in users[:_SAMPLE_SIZE])
+    return usernames + (", ..." if len(users) > _SAMPLE_SIZE else "")
+
 class ComprehensiveCleanup:
     def __init__(self, dry_run=False):
         self.dry_run = dry_run
@@ -95,10 +105,11 @@ class ComprehensiveCleanup:
         logger.info("🧹 Cleaning up Redis rooms...")
         
         try:
-            # Get all room keys
-            room_keys = self.redis_client.keys('chat:room:*')
+            # Enumerate room keys with SCAN so a large keyspace never blocks Redis
+            room_keys = list(self.redis_client.scan_iter(match='chat:room:*', count=_BATCH_SIZE))
             deleted_rooms = 0
             preserved_rooms = []
+            room_ids = []
             
             for room_key in room_keys:
                 # Extract room_id from key
@@ -109,36 +120,47 @@ class ComprehensiveCleanup:
                     preserved_rooms.append(room_id)
                     continue
                 
-                if not self.dry_run:
-                    # Delete room data
-                    self.redis_client.delete(room_key)
-                    
-                    # Delete room messages
-                    self.redis_client.delete(f'chat:messages:{room_id}')
-                    
-                    # Delete room users
-                    self.redis_client.delete(f'chat:room_users:{room_id}')
-                
+                room_ids.append(room_id)
                 deleted_rooms += 1
-                logger.info(f"  {'[DRY RUN] Would delete' if self.dry_run else '✅ Deleted'} room: {room_id}")
+                logger.debug(f"  {'[DRY RUN] Would delete' if self.dry_run else '✅ Deleted'} room: {room_id}")
+            
+            if not self.dry_run:
+                # Room data, messages and their payloads, room users and
+                # assigned users, unlinked in pipelined batches
+                pipe = self.redis_client.pipeline(transaction=False)
+                for start in range(0, len(room_ids), _BATCH_SIZE):
+                    batch = room_ids[start:start + _BATCH_SIZE]
+                    for room_id in batch:
+                        pipe.unlink(
+                            f'chat:room:{room_id}',
+                            f'chat:messages:{room_id}', f'chat:payloads:{room_id}',
+                            f'chat:room_users:{room_id}', f'chat:room_assigned:{room_id}'
+                        )
+                    pipe.srem('chat:rooms:index', *batch)
+                    pipe.execute()
             
             # Clean up orphaned individual message keys
-            message_keys = self.redis_client.keys('chat:message:*')
+            message_keys = list(self.redis_client.scan_iter(match='chat:message:*', count=_BATCH_SIZE))
             deleted_messages = 0
             
-            for msg_key in message_keys:
-                msg_data = self.redis_client.hgetall(msg_key)
-                if msg_data:
-                    room_id = msg_data.get('chat_room_id')
-                    if room_id and room_id != 'general':
-                        if not self.dry_run:
-                            self.redis_client.delete(msg_key)
-                        deleted_messages += 1
-                else:
-                    # Delete empty message keys
-                    if not self.dry_run:
-                        self.redis_client.delete(msg_key)
-                    deleted_messages += 1
+            for start in range(0, len(message_keys), _BATCH_SIZE):
+                batch = message_keys[start:start + _BATCH_SIZE]
+                
+                pipe = self.redis_client.pipeline(transaction=False)
+                for msg_key in batch:
+                    pipe.hgetall(msg_key)
+                values = pipe.execute()
+                
+                stale_keys = []
+                for msg_key, msg_data in zip(batch, values):
+                    room_id = msg_data.get('chat_room_id') if msg_data else None
+                    # Delete empty message keys, and messages outside the general room
+                    if not msg_data or (room_id and room_id != 'general'):
+                        stale_keys.append(msg_key)
+                
+                if stale_keys and not self.dry_run:
+                    self.redis_client.unlink(*stale_keys)
+                deleted_messages += len(stale_keys)
             
             logger.info(f"  {'[DRY RUN] Would delete' if self.dry_run else '✅ Deleted'} {deleted_rooms} rooms")
             logger.info(f"  {'[DRY RUN] Would delete' if self.dry_run else '✅ Deleted'} {deleted_messages} orphaned messages")
@@ -155,44 +177,53 @@ class ComprehensiveCleanup:
         logger.info("👥 Cleaning up test users...")
         
         try:
-            # Find all inactive test users
-            test_users = self.db_session.query(UserTable).filter(
+            inactive_test_users = (
                 UserTable.username.like('test_%'),
                 UserTable.is_active == False
-            ).all()
+            )
+            
+            if not self.dry_run:
+                # Delete and report the users in one statement; nothing is loaded into the session
+                test_users = self.db_session.execute(
+                    delete(UserTable).where(*inactive_test_users)
+                    .returning(UserTable.id, UserTable.username)
+                    .execution_options(synchronize_session=False)
+                ).all()
+                self.db_session.commit()
+            else:
+                # Find all inactive test users; only the columns logged below
+                test_users = self.db_session.execute(
+                    select(UserTable.id, UserTable.username).where(*inactive_test_users)
+                ).all()
             
             if not test_users:
                 logger.info("  ✅ No inactive test users found")
                 return 0
             
-            logger.info(f"  📋 Found {len(test_users)} inactive test users:")
-            
-            # Show what we're about to delete
-            for user in test_users:
-                logger.info(f"    - {user.username} (ID: {user.id})")
-            
+            # Show what was deleted: a sample by default, every user with --verbose
             if not self.dry_run:
-                # Delete the users
-                deleted_count = self.db_session.query(UserTable).filter(
-                    UserTable.username.like('test_%'),
-                    UserTable.is_active == False
-                ).delete(synchronize_session=False)
-                
-                self.db_session.commit()
-                logger.success(f"  ✅ Successfully deleted {deleted_count} inactive test users")
+                logger.success(f"  ✅ Successfully deleted {len(test_users)} inactive test users: "
+                               f"{_sample_usernames(test_users)}")
             else:
-                logger.info(f"  [DRY RUN] Would delete {len(test_users)} inactive test users")
+                logger.info(f"  [DRY RUN] Would delete {len(test_users)} inactive test users: "
+                            f"{_sample_usernames(test_users)}")
+            for user in test_users:
+                logger.debug(f"    - {user.username} (ID: {user.id})")
             
-            # Verify cleanup
-            remaining_test_users = self.db_session.query(UserTable).filter(
-                UserTable.username.like('test_%')
-            ).all()
+            # Verify cleanup with a COUNT(*); rows are only read if some remain
+            remaining_count = self.db_session.execute(
+                select(func.count()).select_from(UserTable).where(UserTable.username.like('test_%'))
+            ).scalar_one()
             
-            if remaining_test_users:
-                logger.warning(f"  ⚠️  Still have {len(remaining_test_users)} test users remaining:")
+            if remaining_count:
+                remaining_test_users = self.db_session.execute(
+                    select(UserTable.id, UserTable.username, UserTable.is_active).where(UserTable.username.like('test_%'))
+                ).all()
+                logger.warning(f"  ⚠️  Still have {remaining_count} test users remaining: "
+                               f"{_sample_usernames(remaining_test_users)}")
                 for user in remaining_test_users:
                     status = "active" if user.is_active else "inactive"
-                    logger.info(f"    - {user.username} (ID: {user.id}, {status})")
+                    logger.debug(f"    - {user.username} (ID: {user.id}, {status})")
             else:
                 logger.success("  ✅ All test users have been removed")
             
@@ -211,7 +242,11 @@ class ComprehensiveCleanup:
             rooms = []
             for room_key in room_keys:
                 room_id = room_key.replace('chat:room:', '')
-                room_data = self.redis_client.hgetall(room_key)
+                # Rooms are stored as one JSON value; older ones as a hash of fields
+                if self.redis_client.type(room_key) == 'hash':
+                    room_data = self.redis_client.hgetall(room_key)
+                else:
+                    room_data = json.loads(self.redis_client.get(room_key) or '{}')
                 rooms.append({
                     'id': room_id,
                     'name': room_data.get('room_name', 'Unknown'),
@@ -309,10 +344,9 @@ def main():
     
     args = parser.parse_args()
     
-    # Configure logging
-    if args.verbose:
-        logger.remove()
-        logger.add(sys.stderr, level="DEBUG")
+    # Configure logging; per-room and per-user lines are only shown with --verbose
+    logger.remove()
+    logger.add(sys.stderr, level="DEBUG" if args.verbose else "INFO")
     
     cleanup = None
     try:
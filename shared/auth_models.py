@@ -3,8 +3,8 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.sql import func
 from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel
+from typing import ClassVar, Optional
+from pydantic import BaseModel, ConfigDict
 from enum import Enum
 
 Base = declarative_base()
@@ -13,20 +13,34 @@ class UserRole(str, Enum):
     ADMIN = "admin"
     USER = "user"
 
+# Resolved once so role checks compare against a plain string
+_ADMIN_ROLE = UserRole.ADMIN.value
+
 class UserTable(Base):
     __tablename__ = "users"
+    # Fetch SQL-side defaults (created_at, last_activity) via RETURNING on INSERT and UPDATE
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
     full_name = Column(String(100), nullable=True)
-    role = Column(String(20), default=UserRole.USER.value, nullable=False)
+    role = Column(String(20), default=UserRole.USER.value, nullable=False, index=True)
     is_active = Column(Boolean, default=True, nullable=False)
     is_kid_account = Column(Boolean, default=False, nullable=False)
     avatar_color = Column(String(7), default="#3498db", nullable=False)
     created_at = Column(DateTime, default=func.now(), nullable=False)
     last_login = Column(DateTime, nullable=True)
-    last_activity = Column(DateTime, default=func.now(), nullable=False)
+    # Any UPDATE that doesn't set it stamps the row with the database clock
+    last_activity = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+    
+    # Left lazy: users are loaded on every authenticated request, sessions almost never
+    sessions = relationship("SessionTable", back_populates="user")
+    
+    @property
+    def is_admin(self) -> bool:
+        """Whether this user has the admin role"""
+        return self.role == _ADMIN_ROLE
 
 class SessionTable(Base):
     __tablename__ = "sessions"
@@ -40,7 +54,8 @@ class SessionTable(Base):
     ip_address = Column(String(45), nullable=True)
     user_agent = Column(Text, nullable=True)
     
-    user = relationship("UserTable", backref="sessions")
+    # Many-to-one, so the owner comes back in the same SELECT
+    user = relationship("UserTable", back_populates="sessions", lazy="joined")
 
 # Pydantic Models for API
 class UserBase(BaseModel):
@@ -60,6 +75,15 @@ class UserUpdate(BaseModel):
     is_active: Optional[bool] = None
     is_kid_account: Optional[bool] = None
 
+class UserUpdateSelf(UserUpdate):
+    """Self-service update: role, is_active and is_kid_account are not fields,
+    so sending any of them fails validation"""
+    model_config = ConfigDict(extra="forbid")
+    
+    role: ClassVar[Optional[UserRole]] = None
+    is_active: ClassVar[Optional[bool]] = None
+    is_kid_account: ClassVar[Optional[bool]] = None
+
 class UserInDB(UserBase):
     id: int
     role: UserRole
@@ -96,6 +120,7 @@ class LoginResponse(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
     user_id: Optional[int] = None
+    exp: Optional[int] = None  # Expiry as a unix timestamp
 
 class PasswordChangeRequest(BaseModel):
     current_password: str
@@ -1,10 +1,11 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, Uuid
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
 from typing import Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import AliasChoices, BaseModel, Field
 from enum import Enum
 
 # Import the existing Base from auth_models to ensure same declarative base
@@ -34,14 +35,18 @@ class ChatMessageTable(Base):
     __tablename__ = "chat_messages"
     
     id = Column(Integer, primary_key=True, index=True)
-    message_id = Column(String(50), unique=True, index=True, nullable=False)
+    # uuid4 strings: native UUID (16 bytes) on PostgreSQL, CHAR(32) elsewhere; still str in Python
+    message_id = Column(Uuid(as_uuid=False), unique=True, index=True, nullable=False)
     chat_room_id = Column(String(50), ForeignKey("chat_rooms.room_id"), nullable=False)
     sender_id = Column(String(50), nullable=False)  # Can be user ID or AI identifier
     sender_name = Column(String(100), nullable=False)
     content = Column(Text, nullable=False)
     message_type = Column(String(20), default="user", nullable=False)  # user, ai, system
     timestamp = Column(DateTime, default=func.now(), nullable=False)
-    metadata = Column(JSON, nullable=True)  # Store additional metadata as JSON
+    # Additional metadata as JSON, JSONB on PostgreSQL (stored parsed, not re-parsed
+    # on read). Stored in the "metadata" column; the attribute can't be named that,
+    # since declarative reserves it for the table registry (Base.metadata)
+    meta_data = Column("metadata", JSON().with_variant(JSONB(), "postgresql"), nullable=True)
     
     # Relationships
     room = relationship("ChatRoomTable", back_populates="messages")
@@ -73,7 +78,8 @@ class ChatMessageResponse(BaseModel):
     content: str
     message_type: str
     timestamp: datetime
-    metadata: Optional[Dict[str, Any]]
+    # Read from ChatMessageTable.meta_data; serialized as "metadata"
+    metadata: Optional[Dict[str, Any]] = Field(validation_alias=AliasChoices("meta_data", "metadata"))
     
     class Config:
         from_attributes = True
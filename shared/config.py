@@ -1,9 +1,19 @@
 import os
 from dotenv import load_dotenv
-from typing import Optional
+from types import MappingProxyType
+from typing import Mapping, Optional
 
 load_dotenv()
 
+# Fixed security headers, built once and shared read-only by every caller
+_SECURITY_HEADERS = MappingProxyType({
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+    "Content-Security-Policy": "default-src 'self'; script-src 'self' 'unsafe-inline'; style-src 'self' 'unsafe-inline';",
+})
+
 
 class Config:
     # Redis Configuration
@@ -12,6 +22,7 @@ class Config:
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", "6379"))
     REDIS_DB: int = int(os.getenv("REDIS_DB", "0"))
     REDIS_PASSWORD: Optional[str] = os.getenv("REDIS_PASSWORD")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
     
     # Backend Configuration
     BACKEND_HOST: str = os.getenv("BACKEND_HOST", "localhost")
@@ -20,22 +31,34 @@ class Config:
     # AI Model Configuration
     AI_MODEL_URL: str = os.getenv("AI_MODEL_URL", "http://localhost:1234")
     AI_API_KEY: Optional[str] = os.getenv("AI_API_KEY")
+    AI_MAX_CONCURRENCY: int = int(os.getenv("AI_MAX_CONCURRENCY", "50"))  # Matches the per-host connection limit
     
     # ElevenLabs Text-to-Speech Configuration
     ELEVENLABS_API_KEY: Optional[str] = os.getenv("ELEVENLABS_API_KEY")
     ELEVENLABS_VOICE_ID: str = os.getenv("ELEVENLABS_VOICE_ID", "N2lVS1w4EtoT3dr4eOWO")  # Callum voice
     ELEVENLABS_MODEL: str = os.getenv("ELEVENLABS_MODEL", "eleven_flash_v2_5")
+    ELEVENLABS_LATENCY_MODE: int = int(os.getenv("ELEVENLABS_LATENCY_MODE", "3"))  # optimize_streaming_latency, 0-4
     
     # Application Configuration
     DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
+    # In debug mode, fail instead of warn when an n+1 lazy-load pattern is detected (for CI)
+    N_PLUS_ONE_RAISE: bool = os.getenv("N_PLUS_ONE_RAISE", "false").lower() == "true"
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     
+    # Database Connection Pool
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+    
     # Chat Configuration
     MAX_MESSAGE_LENGTH: int = int(os.getenv("MAX_MESSAGE_LENGTH", "2000"))
     MAX_CHAT_HISTORY: int = int(os.getenv("MAX_CHAT_HISTORY", "100"))
     AI_RESPONSE_TIMEOUT: int = int(os.getenv("AI_RESPONSE_TIMEOUT", "30"))
+    ROOM_CACHE_TTL_SECONDS: int = int(os.getenv("ROOM_CACHE_TTL_SECONDS", "30"))
     
     # Security Configuration
+    ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
     ALLOWED_ORIGINS: list = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000,http://daddo.hopto.org:3000,https://daddo.hopto.org:3443").split(",")
     SESSION_TIMEOUT_MINUTES: int = int(os.getenv("SESSION_TIMEOUT_MINUTES", "480"))
     MAX_LOGIN_ATTEMPTS: int = int(os.getenv("MAX_LOGIN_ATTEMPTS", "5"))
@@ -43,14 +66,21 @@ class Config:
     REQUIRE_STRONG_PASSWORDS: bool = os.getenv("REQUIRE_STRONG_PASSWORDS", "true").lower() == "true"
     MIN_PASSWORD_LENGTH: int = int(os.getenv("MIN_PASSWORD_LENGTH", "8"))
     ENABLE_AUDIT_LOGGING: bool = os.getenv("ENABLE_AUDIT_LOGGING", "true").lower() == "true"
+    USER_CACHE_TTL_SECONDS: int = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+    ACTIVITY_FLUSH_SECONDS: float = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "5"))
     
-    # Dummy hash for timing attack prevention (security feature)
-    DUMMY_PASSWORD_HASH: str = os.getenv("DUMMY_PASSWORD_HASH", "$2b$12$dummy.hash.to.prevent.timing.attacks.and.username.enumeration")
+    # Argon2id parameters; also used for the dummy hash that equalizes unknown-user login timing.
+    # Each concurrent hash holds ARGON2_MEMORY_KIB of memory.
+    ARGON2_TIME_COST: int = int(os.getenv("ARGON2_TIME_COST", "2"))
+    ARGON2_MEMORY_KIB: int = int(os.getenv("ARGON2_MEMORY_KIB", "65536"))
+    ARGON2_PARALLELISM: int = int(os.getenv("ARGON2_PARALLELISM", "1"))
     
     # Rate Limiting Configuration
     API_RATE_LIMIT: str = os.getenv("API_RATE_LIMIT", "100/minute")
     WS_RATE_LIMIT: str = os.getenv("WS_RATE_LIMIT", "30/minute")
     AUTH_RATE_LIMIT: str = os.getenv("AUTH_RATE_LIMIT", "5/minute")
+    # Shared rate limit counters for all workers; defaults to REDIS_URL / REDIS_* when unset
+    RATE_LIMIT_STORAGE_URI: Optional[str] = os.getenv("RATE_LIMIT_STORAGE_URI")
     
     # Default Chat Room
     DEFAULT_ROOM_ID: str = "general"
@@ -68,6 +98,11 @@ class Config:
             return f"redis://:{cls.REDIS_PASSWORD}@{cls.REDIS_HOST}:{cls.REDIS_PORT}/{cls.REDIS_DB}"
         return f"redis://{cls.REDIS_HOST}:{cls.REDIS_PORT}/{cls.REDIS_DB}"
     
+    @classmethod
+    def get_rate_limit_storage_uri(cls) -> str:
+        """Get rate limiter storage URI"""
+        return cls.RATE_LIMIT_STORAGE_URI or cls.get_redis_url()
+    
     @classmethod
     def get_backend_url(cls) -> str:
         """Get backend WebSocket URL"""
@@ -76,28 +111,30 @@ class Config:
     @classmethod
     def is_production(cls) -> bool:
         """Check if running in production environment"""
-        return os.getenv("ENVIRONMENT", "development").lower() == "production"
+        return cls.ENVIRONMENT.lower() == "production"
     
     @classmethod
-    def get_security_headers(cls) -> dict:
-        """Get security headers for HTTP responses"""
-        return {
-            "X-Content-Type-Options": "nosniff",
-            "X-Frame-Options": "DENY",
-            "X-XSS-Protection": "1; mode=block",
-            "Referrer-Policy": "strict-origin-when-cross-origin",
-            "Content-Security-Policy": "default-src 'self'; script-src 'self' 'unsafe-inline'; style-src 'self' 'unsafe-inline';",
-        }
+    def get_security_headers(cls) -> Mapping[str, str]:
+        """Get security headers for HTTP responses (read-only)"""
+        return _SECURITY_HEADERS
 
 
 # Redis Keys
 class RedisKeys:
     CHAT_MESSAGES = "chat:messages:{room_id}"
+    MESSAGE_PAYLOADS = "chat:payloads:{room_id}"
+    ROOM_INDEX = "chat:rooms:index"
+    ROOM_ASSIGNED_USERS = "chat:room_assigned:{room_id}"
+    ROOM_EVENTS = "chat:room_events:{room_id}"  # pub/sub channel
+    USER_INVALIDATIONS = "chat:user_invalidations"  # pub/sub channel
     USER_CONNECTIONS = "chat:connections"
     ROOM_USERS = "chat:room_users:{room_id}"
     USER_STATUS = "chat:user_status:{user_id}"
     AI_QUEUE = "chat:ai_queue"
     MESSAGE_QUEUE = "chat:message_queue:{room_id}"
+    AI_RESPONSE_CACHE = "ai:response:{digest}"
+    AI_MODEL_INFO = "ai:model_info"
+    TTS_AUDIO_CACHE = "tts:cache:{digest}"
 
 
 # WebSocket Event Types
@@ -114,6 +151,7 @@ class WSEventTypes:
     USER_LEFT = "user_left"
     USER_LIST_UPDATED = "user_list_updated"
     AI_TYPING = "ai_typing"
+    AI_RESPONSE_CHUNK = "ai_response_chunk"
     CONNECTION_ESTABLISHED = "connection_established"
     ERROR = "error"
 
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from dataclasses import dataclass, field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -38,7 +39,9 @@ class ChatMessage(BaseModel):
     content: str
     message_type: MessageType
     timestamp: datetime = Field(default_factory=datetime.now)
-    metadata: Dict[str, Any] = Field(default_factory=dict)
+    # A dict of JSON values, always built server-side; Any keeps the object as-is
+    # instead of copying and re-checking every key on each message
+    metadata: Any = Field(default_factory=dict)
     
     class Config:
         json_encoders = {
@@ -47,9 +50,17 @@ class ChatMessage(BaseModel):
     
     def to_websocket_dict(self) -> Dict[str, Any]:
         """Convert to dictionary suitable for WebSocket transmission"""
-        data = self.dict()
-        data['timestamp'] = self.timestamp.isoformat()
-        return data
+        # Built by hand: this runs for every broadcast message, and dict() re-walks the model
+        return {
+            "message_id": self.message_id,
+            "chat_room_id": self.chat_room_id,
+            "sender_id": self.sender_id,
+            "sender_name": self.sender_name,
+            "content": self.content,
+            "message_type": self.message_type.value,
+            "timestamp": self.timestamp.isoformat(),
+            "metadata": self.metadata
+        }
 
 
 class ChatRoom(BaseModel):
@@ -74,9 +85,11 @@ class ChatRoom(BaseModel):
         }
 
 
-class AIConfig(BaseModel):
+@dataclass(frozen=True, slots=True)
+class AIConfig:
+    """AI model settings; built from Config rather than user input, so not validated"""
     model_url: str = "http://localhost:1234"
-    api_key: Optional[str] = None
+    api_key: Optional[str] = field(default=None, repr=False)  # kept out of logged reprs
     model_name: str = "meta-llama-3.1-8b-instruct"
     system_prompt: str = "You are a helpful AI assistant participating in a group chat. Be friendly and engaging."
     temperature: float = 0.7
@@ -90,8 +103,15 @@ class WebSocketMessage(BaseModel):
     user_id: Optional[str] = None
 
 
-class ConnectionInfo(BaseModel):
+@dataclass(frozen=True, slots=True)
+class ConnectionInfo:
+    """Live connection details; built internally once per connection, so not validated"""
     user_id: str
     username: str
     room_id: str
-    websocket_id: str 
\ No newline at end of file
+    websocket_id: str
+
+
+# Serializes a list of messages to JSON in one pydantic-core pass; the output
+# matches to_websocket_dict() for each message
+message_list_adapter = TypeAdapter(List[ChatMessage])